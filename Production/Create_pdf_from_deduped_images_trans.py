@@ -1,7 +1,6 @@
 # this code will read dedubed images from transcriptsT and deduped images from
 # Unique_framesT folder and creates .pdf
 import os
-import re
 from datetime import datetime
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
@@ -13,12 +12,19 @@ from reportlab.platypus import (
     Paragraph,
     Spacer
 )
+from transcript_parser import read_transcript
+from frame_index import FrameIntervalIndex, load_frame_timeline
+from frame_catalog import open_catalog
 
 # Configure directories
 BASE_DIR = r'D:\\AI_train_data\\Train_Prod'
 TRANSCRIPT_DIR = os.path.join(BASE_DIR, 'transcriptsT')
 UNIQUE_FRAMES_DIR = os.path.join(BASE_DIR, 'unique_framesT')
 PDF_OUTPUT_DIR = os.path.join(BASE_DIR, 'pdf_outputT')
+# Cluster manifests written by V4DS1vid3 (per video) and dedupe_imagesR4
+MANIFEST_DIR = os.path.join(BASE_DIR, 'manifestT')
+# Frame catalog written by V4DS1vid3 and dedupe_imagesR4
+FRAME_CATALOG_PATH = os.path.join(BASE_DIR, 'frame_catalog.sqlite')
 
 def parse_session_time(timestamp):
     """Convert timestamp to trading session context"""
@@ -35,60 +41,43 @@ def process_transcript(transcript_file):
     
     # Extract timestamps and text
     transcript_path = os.path.join(TRANSCRIPT_DIR, transcript_file)
-    entries = extract_timestamps_and_text(transcript_path)
+    entries = read_transcript(transcript_path)
     
     # Group entries by existing frames
-    frame_entries = group_entries_by_frames(entries)
+    frame_entries = group_entries_by_frames(entries, base_name)
     
     create_pdf(base_name, frame_entries)
 
-def extract_timestamps_and_text(transcript_path):
-    """Extract timestamps and text using improved regex"""
-    timestamp_pattern = r'\[(\d{2}:\d{2}(?::\d{2})?)\]\s*(.*?)(?=\[|$)'
-    entries = []
-    
-    with open(transcript_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-        matches = re.findall(timestamp_pattern, content, re.DOTALL)
-        
-        for match in matches:
-            timestamp, text = match
-            time_parts = list(map(int, timestamp.split(':')))
-            total_seconds = sum(
-                part * 60**i for i, part in enumerate(reversed(time_parts))
-            )
-            
-            entries.append({
-                'timestamp': total_seconds,
-                'text': text.strip()
-            })
-    
-    return entries
+def group_entries_by_frames(entries, base_name):
+    """Group text entries under the frame that was on screen at their time
 
-def group_entries_by_frames(entries):
-    """Group text entries by existing frame files"""
+    Frames are placed on the video's timeline by name (<video>_<seconds>.jpg)
+    or, for hash-named frames, through the cluster manifests, and each entry
+    goes to the frame whose span covers it (see frame_index). Videos recorded
+    in the frame catalog are looked up there without listing the folder.
+    """
     frame_entries = {}
-    
-    # Get all existing frame files
-    frame_files = {
-        os.path.splitext(f)[0]: os.path.join(UNIQUE_FRAMES_DIR, f)
-        for f in os.listdir(UNIQUE_FRAMES_DIR)
-        if f.endswith('.jpg')
-    }
+    manifests = [
+        os.path.join(MANIFEST_DIR, f"{base_name}.clusters.{fmt}") for fmt in ('json', 'csv')
+    ] + [f"{UNIQUE_FRAMES_DIR.rstrip(os.sep + '/')}.clusters.{fmt}" for fmt in ('json', 'csv')]
+    catalog = open_catalog(FRAME_CATALOG_PATH)
+    timeline = load_frame_timeline(UNIQUE_FRAMES_DIR, base_name, manifests, catalog)
+    if catalog is not None:
+        catalog.close()
+    index = FrameIntervalIndex(timeline)
     
     for entry in entries:
-        # Frame files are named with their hash, we'll match by timestamp
-        # This assumes frame files contain timestamp in their name
-        frame_hash = f"{entry['timestamp']}"
-        if frame_hash in frame_files:
-            if frame_hash not in frame_entries:
-                frame_entries[frame_hash] = {
-                    'image_path': frame_files[frame_hash],
-                    'texts': [entry['text']],
-                    'timestamp': entry['timestamp']
-                }
-            else:
-                frame_entries[frame_hash]['texts'].append(entry['text'])
+        image_path = index.lookup(entry.timestamp)
+        if image_path is None:
+            continue
+        if image_path not in frame_entries:
+            frame_entries[image_path] = {
+                'image_path': image_path,
+                'texts': [entry.text],
+                'timestamp': entry.timestamp
+            }
+        else:
+            frame_entries[image_path]['texts'].append(entry.text)
     
     return list(frame_entries.values())
 
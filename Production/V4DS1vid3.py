@@ -1,6 +1,5 @@
 import os
-import re
-import cv2
+import math
 import hashlib
 from datetime import datetime
 from PIL import Image
@@ -15,7 +14,25 @@ from reportlab.platypus import (
     Spacer
 )
 import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import imagehash
+from frame_extraction import (
+    extract_frames_sequential,
+    detect_scene_changes,
+    video_duration,
+    hash_frame,
+    write_frame
+)
+from file_utils import link_or_copy
+from frame_store import FrameStore
+from frame_pipeline import FramePipeline
+from pair_manifest import PairManifest
+from hash_index import HashIndex, hamming_distance
+from cluster_manifest import write_cluster_manifest
+from transcript_parser import read_transcript
+from frame_index import FrameIntervalIndex
+from frame_catalog import FrameCatalog, describe_image
 
 # Updated directories with 'T' suffix
 BASE_DIR = r'D:\\AI_train_data\\Train_Prod'
@@ -24,45 +41,70 @@ VIDEO_DIR = os.path.join(BASE_DIR, 'videosT')
 FRAMES_DIR = os.path.join(BASE_DIR, 'framesT')
 UNIQUE_FRAMES_DIR = os.path.join(BASE_DIR, 'unique_frames')
 PDF_OUTPUT_DIR = os.path.join(BASE_DIR, 'pdf_outputT')
+# Per-worker scratch space; must be on the same volume as the output folders
+SCRATCH_DIR = os.path.join(BASE_DIR, 'scratchT')
+# Per-pair records of completed stages, used to skip unchanged pairs
+MANIFEST_DIR = os.path.join(BASE_DIR, 'manifestT')
+# Persistent index of every unique frame hash, shared across runs and videos
+HASH_INDEX_PATH = os.path.join(BASE_DIR, 'frame_hashes.sqlite')
+# Catalog of which unique frame shows each video at each sampled second,
+# queried by the dedupe, PDF, merge and review scripts
+FRAME_CATALOG_PATH = os.path.join(BASE_DIR, 'frame_catalog.sqlite')
 
-def extract_timestamps_and_text(transcript_path):
-    """Extract timestamps and associated text with improved regex"""
-    timestamp_pattern = r'\[(\d{2}:\d{2}(?::\d{2})?)\]\s*(.*?)(?=\[|$)'
-    entries = []
-    
-    with open(transcript_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-        matches = re.findall(timestamp_pattern, content, re.DOTALL)
-        
-        for match in matches:
-            timestamp, text = match
-            time_parts = list(map(int, timestamp.split(':')))
-            total_seconds = sum(
-                part * 60**i for i, part in enumerate(reversed(time_parts))
-            )
-            
-            entries.append({
-                'timestamp': total_seconds,
-                'text': text.strip()
-            })
-    
-    return entries
-
-def extract_frame(video_path, timestamp_seconds, output_path):
-    """Extracts frame at specified timestamp using OpenCV with error handling"""
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print(f"Error opening video: {video_path}")
-        return False
-    
-    cap.set(cv2.CAP_PROP_POS_MSEC, timestamp_seconds * 1000)
-    success, frame = cap.read()
-    
-    if success:
-        cv2.imwrite(output_path, frame)
-        return True
-    print(f"Failed to extract frame at {timestamp_seconds}s from {video_path}")
-    return False
+# Number of video/transcript pairs processed in parallel (1 = serial)
+WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# Long videos are split into timeline segments of about this many seconds,
+# each decoded by its own thread with its own VideoCapture
+SEGMENT_SECONDS = 20 * 60
+MAX_SEGMENT_WORKERS = 4
+# Per-segment streaming pipeline: hashing threads, encoder/writer threads and
+# the number of frames allowed to queue between stages
+PIPELINE_HASH_WORKERS = 2
+PIPELINE_WRITE_WORKERS = 2
+PIPELINE_QUEUE_SIZE = 4
+
+# Stored frames are encoded on the pipeline's writer threads as FRAME_FORMAT
+# ('jpg', 'webp' or 'png') at that format's FRAME_QUALITY (JPEG quality 0-100,
+# WebP quality 1-100, PNG compression level 0-9), downscaled first when wider
+# than FRAME_MAX_WIDTH. JPEG and PNG keep OpenCV's defaults (95 and 1); WebP
+# would default to lossless, so it gets a lossy 90. The downstream PDF, dedupe
+# and review scripts only pick up '.jpg' files.
+FRAME_FORMAT = 'jpg'
+FRAME_QUALITY = {'jpg': 95, 'webp': 90, 'png': 1}
+FRAME_MAX_WIDTH = None
+
+# Hash decoded frames in memory and write JPEGs only for unique frames.
+# KEEP_RAW_FRAMES additionally keeps every extracted frame in FRAMES_DIR.
+HASH_FIRST = True
+KEEP_RAW_FRAMES = False
+
+# 'transcript' takes one frame per transcript timestamp; 'scene' takes one
+# frame per detected slide/chart change and attaches transcript text by time
+SAMPLING_MODE = 'transcript'
+
+# Bump when frame-stage output changes so the manifest reprocesses every pair;
+# FORCE_REPROCESS ignores the manifest for one run.
+# 2: transcript_parser keeps the entries past minute 99 that the old regex lost
+FRAME_STAGE_VERSION = 2
+FORCE_REPROCESS = False
+
+# A frame within this many bits (of 256) of an indexed frame reuses it
+# instead of being stored again. Hash-first frames are hashed from a thumbnail
+# of the decoded frame, which can differ by 1-3 bits from the hash of the
+# re-read JPEG that older runs stored (and import_folder seeds), so 0 would
+# store about a third of those slides again under new hashes. 4 bridges that
+# gap; it also folds near-duplicates (re-encodes, a moving cursor) into one
+# stored frame, and kept precision at 1.0 on the bench_dedupe fixture.
+NEAR_DUPLICATE_RADIUS = 4
+# Per pair, which sampled frames (<video>_<seconds>) were folded into which
+# unique frame, with a hash similarity score (1 - differing bits / hash bits),
+# is written to MANIFEST_DIR/<video>.clusters.<fmt>; 'json' or 'csv'
+CLUSTER_MANIFEST_FORMAT = 'json'
+# Store unique frames content-addressed in two levels of hash-prefix folders
+# (UNIQUE_FRAMES_DIR/ab/cd/<hash>.jpg, see frame_store.py) instead of one flat
+# folder. Frames already stored flat are still found; frame_store.py --migrate
+# moves them into the shards.
+SHARDED_FRAME_STORE = False
 
 def parse_session_time(timestamp):
     """Convert timestamp to trading session context"""
@@ -72,54 +114,249 @@ def parse_session_time(timestamp):
     if 16 <= hour < 20:  return "Afterhours"
     return "Extended Hours"
 
-def process_video_transcript_pair(transcript_file, video_file):
-    """Process video/transcript pair with enhanced error handling"""
+def split_timeline(timestamps, segment_seconds=SEGMENT_SECONDS):
+    """Split sorted timestamps into contiguous segments of roughly equal duration"""
+    if not timestamps:
+        return []
+    span = timestamps[-1] - timestamps[0]
+    count = max(1, math.ceil(span / segment_seconds)) if segment_seconds else 1
+    segments = [[] for _ in range(count)]
+    for timestamp in timestamps:
+        index = min(count - 1, int((timestamp - timestamps[0]) * count / (span or 1)))
+        segments[index].append(timestamp)
+    return [segment for segment in segments if segment]
+
+def split_duration(duration, segment_seconds=SEGMENT_SECONDS):
+    """Split [0, duration) into (start, end) ranges of about segment_seconds"""
+    if not duration or not segment_seconds:
+        return [(0, None)]
+    count = max(1, math.ceil(duration / segment_seconds))
+    bounds = [duration * i / count for i in range(count)] + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _write_image(path, frame):
+    """Encode and write a frame with the configured format, quality and size"""
+    write_frame(path, frame, FRAME_FORMAT, FRAME_QUALITY[FRAME_FORMAT], FRAME_MAX_WIDTH)
+
+def _scan_segment(frames, base_name, stage_dir, tag,
+                  hash_first, write_raw_frames):
+    """Hash one timeline segment's (timestamp, frame) stream
+
+    frames is a lazy generator that a FramePipeline decodes on its own thread
+    while other threads hash and encode/write, with bounded queues between
+    them. Returns (timestamp, frame_hash, staged_path) in timestamp order. The
+    first frame of each hash within the segment is staged as
+    <hash>_<tag>.<FRAME_FORMAT>; later repeats have no staged file. Deduplication across
+    segments is left to the caller, which sees every segment's results in
+    order.
+    """
+    def raw_path(timestamp):
+        return os.path.join(FRAMES_DIR, base_name,
+                            f"{base_name}_{int(timestamp)}.{FRAME_FORMAT}")
+
+    def hash_fn(timestamp, frame):
+        if hash_first:
+            return hash_frame(frame)
+        # Legacy path: hash the JPEG as written to disk
+        _write_image(raw_path(timestamp), frame)
+        with Image.open(raw_path(timestamp)) as img:
+            return str(imagehash.average_hash(img, hash_size=16))
+
+    results = []
+    staged_hashes = set()
+    with FramePipeline(hash_fn,
+                       hash_workers=PIPELINE_HASH_WORKERS,
+                       write_workers=PIPELINE_WRITE_WORKERS,
+                       queue_size=PIPELINE_QUEUE_SIZE) as pipeline:
+        for timestamp, frame_hash, frame in pipeline.run(frames):
+            if write_raw_frames and hash_first:
+                pipeline.write(_write_image, raw_path(timestamp), frame)
+
+            staged_path = None
+            if frame_hash not in staged_hashes:
+                staged_path = os.path.join(stage_dir, f"{frame_hash}_{tag}.{FRAME_FORMAT}")
+                if hash_first:
+                    pipeline.write(_write_image, staged_path, frame)
+                else:
+                    pipeline.write(link_or_copy, raw_path(timestamp), staged_path,
+                                   ('hardlink', 'copy'))
+                staged_hashes.add(frame_hash)
+            results.append((timestamp, frame_hash, staged_path))
+    return results
+
+def stage_version(hash_first, keep_raw_frames, sampling_mode):
+    """Code/config version recorded in the manifest for the frame stage"""
+    return (f"{FRAME_STAGE_VERSION}:{'hash' if hash_first else 'legacy'}:"
+            f"{'raw' if keep_raw_frames else 'noraw'}:{sampling_mode}:"
+            f"r{NEAR_DUPLICATE_RADIUS}:{FRAME_FORMAT}{FRAME_QUALITY[FRAME_FORMAT]}:{FRAME_MAX_WIDTH}")
+
+def process_video_transcript_pair(transcript_file, video_file,
+                                  hash_first=HASH_FIRST,
+                                  keep_raw_frames=KEEP_RAW_FRAMES,
+                                  scratch_dir=None,
+                                  sampling_mode=SAMPLING_MODE,
+                                  force=FORCE_REPROCESS):
+    """Process video/transcript pair with enhanced error handling
+
+    Completed stages ('frames', then 'pdf') are recorded in a per-pair
+    manifest under MANIFEST_DIR. A pair whose files and settings are
+    unchanged is skipped, and an interrupted pair resumes after its last
+    completed stage. The PDF is built in a private scratch directory and
+    moved into place when complete. Returns the number of unique frames.
+    """
     base_name = os.path.splitext(transcript_file)[0]
-    
-    # Create directories with validation
-    for dir_path in [
-        os.path.join(FRAMES_DIR, base_name),
-        UNIQUE_FRAMES_DIR,
-        PDF_OUTPUT_DIR
-    ]:
+    transcript_path = os.path.join(TRANSCRIPT_DIR, transcript_file)
+    video_path = os.path.join(VIDEO_DIR, video_file)
+    manifest = PairManifest(MANIFEST_DIR, transcript_path, video_path,
+                            stage_version(hash_first, keep_raw_frames, sampling_mode))
+    if force:
+        manifest.stages.clear()
+
+    image_entries = manifest.get('frames')
+    if image_entries is not None and not all(
+            os.path.exists(entry['image_path']) for entry in image_entries):
+        image_entries = None  # unique frames were removed since the last run
+    if image_entries is not None and manifest.is_done('pdf') and os.path.exists(
+            os.path.join(PDF_OUTPUT_DIR, f"{base_name}.pdf")):
+        print(f"Skipping {base_name}: unchanged since last run")
+        return len(image_entries)
+
+    for dir_path in [UNIQUE_FRAMES_DIR, PDF_OUTPUT_DIR, SCRATCH_DIR]:
         os.makedirs(dir_path, exist_ok=True)
+    own_scratch = scratch_dir is None
+    if own_scratch:
+        scratch_dir = tempfile.mkdtemp(prefix=f"{base_name}_", dir=SCRATCH_DIR)
+    try:
+        if image_entries is None:
+            manifest.stages.pop('pdf', None)
+            image_entries = extract_unique_frames(
+                transcript_path, video_path, base_name, scratch_dir,
+                hash_first, keep_raw_frames, sampling_mode
+            )
+            manifest.mark_done('frames', image_entries)
+
+        create_pdf(base_name, image_entries, build_dir=scratch_dir)
+        manifest.mark_done('pdf', os.path.join(PDF_OUTPUT_DIR, f"{base_name}.pdf"))
+    finally:
+        if own_scratch:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+    return len(image_entries)
+
+def extract_unique_frames(transcript_path, video_path, base_name, scratch_dir,
+                          hash_first, keep_raw_frames, sampling_mode):
+    """Frame stage: sample, hash and dedupe frames and attach transcript text
+
+    Frames are sampled at transcript timestamps or, in 'scene' sampling mode,
+    at detected slide/chart changes. The timeline is split into segments that
+    are decoded in parallel (see SEGMENT_SECONDS) and merged back in timestamp
+    order. Unique frames are staged in scratch_dir and published into
+    UNIQUE_FRAMES_DIR (see SHARDED_FRAME_STORE) atomically, so parallel
+    workers producing the same frame hash never race. The duplicate clusters
+    are written next to the pair's manifest and every sampled frame is
+    recorded in the frame catalog.
+    Returns the unique entries in timestamp order.
+    """
+    # The legacy path hashes the JPEG on disk, so it always needs raw frames
+    write_raw_frames = keep_raw_frames or not hash_first
+    if write_raw_frames:
+        os.makedirs(os.path.join(FRAMES_DIR, base_name), exist_ok=True)
 
     # Process timestamps and text
-    transcript_path = os.path.join(TRANSCRIPT_DIR, transcript_file)
-    video_path = os.path.join(VIDEO_DIR, video_file)
-    entries = extract_timestamps_and_text(transcript_path)
+    entries = read_transcript(transcript_path)
     
-    unique_entries = {}
+    # Group entries by second so every frame is decoded once, in one pass
+    texts_by_timestamp = {}
     for entry in entries:
-        try:
-            frame_filename = f"{base_name}_{entry['timestamp']}.jpg"
-            output_path = os.path.join(FRAMES_DIR, base_name, frame_filename)
-            
-            if extract_frame(video_path, entry['timestamp'], output_path):
-                with Image.open(output_path) as img:
-                    frame_hash = str(imagehash.average_hash(img, hash_size=16))
-                    
-                unique_path = os.path.join(UNIQUE_FRAMES_DIR, f"{frame_hash}.jpg")
-                if frame_hash not in unique_entries:
-                    shutil.copy(output_path, unique_path)
-                    unique_entries[frame_hash] = {
+        texts_by_timestamp.setdefault(entry.timestamp, []).append(entry.text)
+
+    if sampling_mode == 'scene':
+        frame_sources = [
+            detect_scene_changes(video_path, start, end)
+            for start, end in split_duration(video_duration(video_path), SEGMENT_SECONDS)
+        ]
+    else:
+        frame_sources = [
+            extract_frames_sequential(video_path, segment)
+            for segment in split_timeline(sorted(texts_by_timestamp), SEGMENT_SECONDS)
+        ]
+
+    workers = max(1, min(len(frame_sources), MAX_SEGMENT_WORKERS))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_scan_segment, frames, base_name, scratch_dir,
+                        index, hash_first, write_raw_frames)
+            for index, frames in enumerate(frame_sources)
+        ]
+        frames = [item for future in futures for item in future.result()]
+
+    # Merge in timestamp order: the earliest occurrence of a hash across all
+    # segments is published, copies staged by later segments dropped. Hashes
+    # already in the global index (from any video, within
+    # NEAR_DUPLICATE_RADIUS bits) reuse the stored frame instead.
+    unique_entries = {}
+    canonical = {}  # frame hash -> hash of the stored frame it maps to
+    clusters = {}   # unique frame path -> [(frame name, similarity)]
+    catalog_rows = []
+    image_info = {}  # unique frame path -> (size, width, height)
+    video_id = os.path.splitext(os.path.basename(transcript_path))[0]
+    frame_store = FrameStore(UNIQUE_FRAMES_DIR, f".{FRAME_FORMAT}", SHARDED_FRAME_STORE)
+    with HashIndex(HASH_INDEX_PATH) as index:
+        for timestamp, frame_hash, staged_path in frames:
+            if frame_hash not in canonical:
+                match = index.find(frame_hash, NEAR_DUPLICATE_RADIUS)
+                if match:
+                    canonical[frame_hash], unique_path = match
+                elif staged_path and os.path.exists(staged_path):
+                    unique_path = frame_store.publish(staged_path, frame_hash)
+                    index.add(frame_hash, unique_path, video_id, int(timestamp))
+                    canonical[frame_hash] = frame_hash
+                else:
+                    continue  # the write of this frame failed and was reported
+
+                if canonical[frame_hash] not in unique_entries:
+                    unique_entries[canonical[frame_hash]] = {
                         'image_path': unique_path,
-                        'texts': [entry['text']],
-                        'timestamp': entry['timestamp']
+                        'texts': [],
+                        'timestamp': int(timestamp)
                     }
-                else:
-                    unique_entries[frame_hash]['texts'].append(entry['text'])
-                    
-        except Exception as e:
-            print(f"Error processing {entry['timestamp']}: {str(e)}")
-            continue
+            if frame_hash in canonical:
+                unique_hash = canonical[frame_hash]
+                similarity = 1 - hamming_distance(frame_hash, unique_hash) / (4 * len(frame_hash))
+                unique_path = unique_entries[unique_hash]['image_path']
+                clusters.setdefault(unique_path, []).append(
+                    (f"{video_id}_{int(timestamp)}", similarity))
+                if unique_path not in image_info:
+                    image_info[unique_path] = describe_image(unique_path)
+                catalog_rows.append((video_id, int(timestamp), unique_hash, unique_path)
+                                    + image_info[unique_path])
+            if staged_path and os.path.exists(staged_path):
+                os.remove(staged_path)
 
-    create_pdf(base_name, list(unique_entries.values()))
+    if sampling_mode == 'scene':
+        # Each entry belongs to the last scene that started at or before it
+        scenes = FrameIntervalIndex((timestamp, frame_hash) for timestamp, frame_hash, _ in frames)
+        for entry in entries:
+            frame_hash = scenes.lookup(entry.timestamp)
+            if frame_hash in canonical:
+                unique_entries[canonical[frame_hash]]['texts'].append(entry.text)
+    else:
+        for timestamp, frame_hash, _ in frames:
+            if frame_hash in canonical:
+                unique_entries[canonical[frame_hash]]['texts'].extend(
+                    texts_by_timestamp[timestamp])
 
-def create_pdf(base_name, image_entries):
+    write_cluster_manifest(
+        os.path.join(MANIFEST_DIR, f"{base_name}.clusters.{CLUSTER_MANIFEST_FORMAT}"), clusters)
+    with FrameCatalog(FRAME_CATALOG_PATH) as catalog:
+        catalog.add_frames(catalog_rows, replace_video=video_id)
+    return list(unique_entries.values())
+
+def create_pdf(base_name, image_entries, build_dir=None):
     """Generate comprehensive trading analysis PDF"""
     pdf_path = os.path.join(PDF_OUTPUT_DIR, f"{base_name}.pdf")
-    doc = SimpleDocTemplate(pdf_path, pagesize=letter)
+    # Build in the scratch folder and move into place once complete
+    build_path = os.path.join(build_dir, f"{base_name}.pdf") if build_dir else pdf_path
+    doc = SimpleDocTemplate(build_path, pagesize=letter)
     styles = getSampleStyleSheet()
     story = []
     
@@ -183,26 +420,75 @@ def create_pdf(base_name, image_entries):
     story.append(footer)
 
     doc.build(story)
+    if build_path != pdf_path:
+        os.replace(build_path, pdf_path)
     print(f"Generated trading analysis PDF: {pdf_path}")
 
-def main():
-    """Main execution with improved file handling"""
-    with open(os.path.join(BASE_DIR, 'ListTT.txt'), 'r') as f:
+def read_pair_list(list_path):
+    """Read (transcript_file, video_file) pairs from a ListTT.txt file"""
+    pairs = []
+    with open(list_path, 'r') as f:
         for line in f:
             line = line.strip()
             if not line or line.startswith('#'):
                 continue
-                
+
             try:
                 transcript_file, video_file = line.split('|')
-                process_video_transcript_pair(
-                    transcript_file.strip(),
-                    video_file.strip()
-                )
             except ValueError:
                 print(f"Invalid line format: {line}")
-            except FileNotFoundError as e:
-                print(f"File error: {str(e)}")
+                continue
+            pairs.append((transcript_file.strip(), video_file.strip()))
+    return pairs
+
+def _report_pair(results, transcript_file, video_file, run):
+    """Run one pair's processing, print OK/FAIL and append its result"""
+    try:
+        unique_count = run()
+        print(f"OK   {transcript_file} | {video_file}: {unique_count} unique frames")
+        results.append((transcript_file, video_file, True, unique_count))
+    except Exception as e:
+        print(f"FAIL {transcript_file} | {video_file}: {str(e)}")
+        results.append((transcript_file, video_file, False, str(e)))
+
+def run_parallel(pairs, workers=WORKERS):
+    """Process video/transcript pairs and report each result
+
+    Pairs are fanned out to a process pool, or with a single worker processed
+    in-process one after another. Either way a failing pair is reported and
+    the batch moves on to the next one.
+    """
+    results = []
+    if workers <= 1:
+        for transcript_file, video_file in pairs:
+            _report_pair(results, transcript_file, video_file,
+                         lambda: process_video_transcript_pair(transcript_file, video_file))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(process_video_transcript_pair, transcript_file, video_file):
+                    (transcript_file, video_file)
+                for transcript_file, video_file in pairs
+            }
+            for future in as_completed(futures):
+                transcript_file, video_file = futures[future]
+                _report_pair(results, transcript_file, video_file, future.result)
+
+    failed = [r for r in results if not r[2]]
+    print(f"Processed {len(results)} pairs: "
+          f"{len(results) - len(failed)} succeeded, {len(failed)} failed")
+    return results
+
+def main():
+    """Main execution with improved file handling"""
+    pairs = read_pair_list(os.path.join(BASE_DIR, 'ListTT.txt'))
+
+    # First run with the hash index: register the frames already stored
+    with HashIndex(HASH_INDEX_PATH) as index:
+        if index.is_empty() and os.path.isdir(UNIQUE_FRAMES_DIR):
+            count = index.import_folder(UNIQUE_FRAMES_DIR, f".{FRAME_FORMAT}")
+            print(f"Indexed {count} existing unique frames")
+    run_parallel(pairs, WORKERS)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,109 @@
+# Vectorized SSIM of one image against many reference images
+import numpy as np
+from collections import OrderedDict
+
+# Same constants skimage.metrics.structural_similarity uses by default for
+# uint8 grayscale images (7x7 uniform window, sample covariance)
+WIN_SIZE = 7
+K1 = 0.01
+K2 = 0.03
+DATA_RANGE = 255
+COV_NORM = WIN_SIZE * WIN_SIZE / (WIN_SIZE * WIN_SIZE - 1)
+C1 = (K1 * DATA_RANGE) ** 2
+C2 = (K2 * DATA_RANGE) ** 2
+
+# Scores agree with skimage's structural_similarity(a, b) on uint8 grayscale
+# images to within this absolute tolerance (the cached maps are float32)
+SSIM_TOLERANCE = 1e-4
+
+# References compared per vectorized step; bounds the float64 temporaries
+BATCH_SIZE = 64
+
+
+def box_mean(images):
+    """Mean of every full WIN_SIZE x WIN_SIZE window over the last two axes
+
+    skimage filters the whole image and then crops (WIN_SIZE - 1) // 2 pixels
+    from every border before averaging, which leaves exactly the windows that
+    fit inside the image, so only those are computed here (integral image).
+    """
+    images = np.asarray(images, dtype=np.float64)
+    integral = np.zeros(images.shape[:-2] + (images.shape[-2] + 1, images.shape[-1] + 1))
+    np.cumsum(np.cumsum(images, axis=-1), axis=-2, out=integral[..., 1:, 1:])
+    w = WIN_SIZE
+    window_sums = (integral[..., w:, w:] - integral[..., :-w, w:]
+                   - integral[..., w:, :-w] + integral[..., :-w, :-w])
+    return window_sums / (w * w)
+
+
+def mean_and_variance(images):
+    """Windowed means and sample variances of one image or a stack of images"""
+    images = np.asarray(images, dtype=np.float64)
+    mean = box_mean(images)
+    variance = COV_NORM * (box_mean(images * images) - mean * mean)
+    return mean, variance
+
+
+class BatchedSSIM:
+    """SSIM of a candidate against many references in one NumPy operation
+
+    references is any row-indexable store of equally sized uint8 grayscale
+    images (e.g. a SignatureSet). The windowed mean and variance maps of each
+    reference are computed the first time it is compared and kept in an LRU
+    cache of cache_size entries (about 0.5 MB each at 256x256), so repeated
+    comparisons against the same uniques only compute the cross term.
+    """
+
+    def __init__(self, references, cache_size=1024):
+        self.references = references
+        self.cache_size = cache_size
+        self._stats = OrderedDict()
+
+    def _reference_stats(self, rows):
+        missing = [row for row in rows if row not in self._stats]
+        if missing:
+            means, variances = mean_and_variance(
+                np.stack([self.references[row] for row in missing]))
+            for row, mean, variance in zip(missing, means, variances):
+                self._stats[row] = (mean.astype(np.float32), variance.astype(np.float32))
+        for row in rows:
+            self._stats.move_to_end(row)
+        stats = [self._stats[row] for row in rows]
+        while len(self._stats) > self.cache_size:
+            self._stats.popitem(last=False)
+        return stats
+
+    def discard(self, row):
+        """Drop the cached maps of a reference that will not be compared again"""
+        self._stats.pop(row, None)
+
+    def compare(self, image, rows):
+        """Return the SSIM of image against each reference row, as an array"""
+        rows = list(rows)
+        scores = np.empty(len(rows))
+        if not rows:
+            return scores
+        image = np.asarray(image, dtype=np.float64)
+        mean_y, variance_y = mean_and_variance(image)
+
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            stats = self._reference_stats(batch)
+            mean_x = np.stack([mean for mean, _ in stats]).astype(np.float64)
+            variance_x = np.stack([variance for _, variance in stats]).astype(np.float64)
+            references = np.stack([self.references[row] for row in batch]).astype(np.float64)
+
+            covariance = COV_NORM * (box_mean(references * image) - mean_x * mean_y)
+            numerator = (2 * mean_x * mean_y + C1) * (2 * covariance + C2)
+            denominator = (mean_x ** 2 + mean_y ** 2 + C1) * (variance_x + variance_y + C2)
+            scores[start:start + len(batch)] = (numerator / denominator).mean(axis=(-2, -1))
+        return scores
+
+    def best_match(self, image, rows):
+        """Return (row, score) of the most similar reference, or (None, -inf)"""
+        rows = list(rows)
+        if not rows:
+            return None, float('-inf')
+        scores = self.compare(image, rows)
+        best = int(np.argmax(scores))
+        return rows[best], float(scores[best])
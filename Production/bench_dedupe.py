@@ -0,0 +1,386 @@
+# Measures dedupe accuracy and throughput on synthetic chart frames with known
+# near-duplicates, so thresholds and speed changes are judged against ground
+# truth instead of by eye.
+#
+#   python bench_dedupe.py --output dedupe.json
+#   python bench_dedupe.py --compare dedupe.json
+#
+# Every source slide gets variants a viewer would call the same frame: JPEG
+# re-encodes, cursor moves, small crops and brightness shifts. Some slides are
+# shown again later in the video. A duplicate decision is correct when the
+# frame and its representative come from the same slide.
+#
+# 'original' replays the first version of dedupe_imagesR4 (full cv2.imread,
+# resize, grayscale, skimage SSIM against every unique, in file-name order),
+# and every SSIM method is reported as matching it or not at each threshold.
+# 'sharded' runs dedupe_sharded by video with --workers processes and checks
+# that one worker decides the same; it decodes its own inputs, so its images/s
+# include decoding. 'store' dedupes the first half of the frames into a SignatureStore,
+# reopens it and dedupes the rest, as two incremental runs would.
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import contextlib
+import platform
+import tempfile
+from datetime import datetime
+import cv2
+import numpy as np
+
+import dedupe_imagesR4 as dedupe
+import batched_ssim
+from cluster_manifest import ClusterLog
+from signature_store import SignatureStore
+from bench_frame_extraction import make_slide
+
+METHODS = ['original', 'pairwise', 'prefilter', 'grouped', 'grouped_global', 'sharded',
+           'store', 'hash']
+VARIANTS = ['reencode', 'cursor', 'crop', 'brightness']
+
+# Throughput is flagged when it drops by more than this fraction
+REGRESSION_TOLERANCE = 0.10
+# Fast methods are repeated until they have run this long, to steady the timing
+MIN_RUN_SECONDS = 0.5
+
+
+def make_variant(rng, slide, kind):
+    """Return a near-duplicate of slide and the JPEG quality to save it with"""
+    height, width = slide.shape[:2]
+    frame = slide.copy()
+    quality = 90
+    if kind == 'reencode':
+        quality = int(rng.integers(55, 85))
+    elif kind == 'cursor':
+        cursor = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(frame, cursor, 5, (255, 255, 255), -1)
+    elif kind == 'crop':
+        dx = int(rng.integers(1, max(2, width // 50)))
+        dy = int(rng.integers(1, max(2, height // 50)))
+        frame = cv2.resize(frame[dy:height - dy, dx:width - dx], (width, height))
+    elif kind == 'brightness':
+        shift = int(rng.choice([-1, 1]) * rng.integers(8, 20))
+        frame = cv2.convertScaleAbs(frame, alpha=1, beta=shift)
+    return frame, quality
+
+
+def make_fixture(directory, videos, slides, variants, revisit, width, height, seed=0):
+    """Write <video>_<seconds>.jpg frames; return {file name: source slide id}"""
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    truth = {}
+    for video in range(videos):
+        shown = []
+        second = 0
+        for index in range(slides):
+            slide_id = f"v{video}s{index}"
+            slide = make_slide(rng, width, height)
+            shown.append((slide_id, slide))
+            sequence = [(slide, 90)] + [
+                make_variant(rng, slide, VARIANTS[rng.integers(len(VARIANTS))])
+                for _ in range(variants)
+            ]
+            if len(shown) > 3 and rng.random() < revisit:
+                # The presenter goes back to an earlier chart
+                old_id, old_slide = shown[int(rng.integers(len(shown) - 3))]
+                sequence.append(make_variant(rng, old_slide, 'cursor'))
+                ids = [slide_id] * (variants + 1) + [old_id]
+            else:
+                ids = [slide_id] * (variants + 1)
+            for frame_id, (frame, quality) in zip(ids, sequence):
+                name = f"video{video}_{second}.jpg"
+                cv2.imwrite(os.path.join(directory, name), frame,
+                            [cv2.IMWRITE_JPEG_QUALITY, quality])
+                truth[name] = frame_id
+                second += int(rng.integers(2, 6))
+    return truth
+
+
+COMPARISONS = {'count': 0}
+
+
+@contextlib.contextmanager
+def counting_comparisons():
+    """Count the rows BatchedSSIM.compare scores while the block runs"""
+    compare = batched_ssim.BatchedSSIM.compare
+
+    def counting_compare(self, image, rows):
+        rows = list(rows)
+        COMPARISONS['count'] += len(rows)
+        return compare(self, image, rows)
+
+    batched_ssim.BatchedSSIM.compare = counting_compare
+    try:
+        yield
+    finally:
+        batched_ssim.BatchedSSIM.compare = compare
+
+
+def original_signature(path):
+    """The first dedupe_imagesR4's decode: full color imread, resize, grayscale"""
+    return cv2.cvtColor(cv2.resize(cv2.imread(path), (256, 256)), cv2.COLOR_BGR2GRAY)
+
+
+def _pairwise(signatures, log):
+    """skimage SSIM against every unique until one matches, as the original loop"""
+    uniques = []
+    for name, signature in signatures:
+        for unique_name, unique in uniques:
+            COMPARISONS['count'] += 1
+            score = dedupe.ssim(signature, unique)
+            if score > dedupe.SSIM_THRESHOLD:
+                log.add_duplicate(name, unique_name, score)
+                break
+        else:
+            uniques.append((name, signature))
+            log.add_unique(name)
+
+
+def _hash(hashes, log, radius, bits):
+    """Frame-stage style: a duplicate is within radius bits of a unique's hash"""
+    uniques = []
+    for name, frame_hash in hashes:
+        for unique_name, unique_hash in uniques:
+            COMPARISONS['count'] += 1
+            distance = (frame_hash ^ unique_hash).bit_count()
+            if distance <= radius:
+                log.add_duplicate(name, unique_name, 1 - distance / bits)
+                break
+        else:
+            uniques.append((name, frame_hash))
+            log.add_unique(name)
+
+
+def run_method(method, threshold, inputs, workers):
+    """Run one method at one threshold
+
+    Returns (ClusterLog, seconds per run, comparisons per run). Comparisons
+    made in worker processes are not counted, so sharded runs report None.
+    """
+    dedupe.SSIM_THRESHOLD = threshold
+    runs = 0
+    started = time.perf_counter()
+    with counting_comparisons():
+        while runs == 0 or time.perf_counter() - started < MIN_RUN_SECONDS:
+            log = ClusterLog()
+            COMPARISONS['count'] = 0
+            with contextlib.redirect_stdout(io.StringIO()):
+                _run(method, threshold, inputs, workers, log)
+            runs += 1
+    comparisons = None if method == 'sharded' else COMPARISONS['count']
+    return log, (time.perf_counter() - started) / runs, comparisons
+
+
+def _store_run(signatures, log):
+    """Two incremental runs through a SignatureStore, reopened in between"""
+    directory = tempfile.mkdtemp(prefix='bench_store_')
+    try:
+        half = len(signatures) // 2
+        store = SignatureStore(directory, dedupe.SIGNATURE_SIZE)
+        for _ in dedupe.dedupe_global(iter(signatures[:half]), store, log):
+            pass
+        store.save()
+        del store
+        store = SignatureStore(directory, dedupe.SIGNATURE_SIZE)
+        for _ in dedupe.dedupe_global(iter(signatures[half:]), store, log):
+            pass
+        del store
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _run(method, threshold, inputs, workers, log):
+    signatures = inputs['signatures']
+    flat = inputs['flat']
+    if method == 'original':
+        _pairwise(inputs['original'], log)
+    elif method == 'pairwise':
+        _pairwise(flat, log)
+    elif method == 'prefilter':
+        for _ in dedupe.dedupe_global(iter(flat), log=log):
+            pass
+    elif method == 'grouped':
+        for _ in dedupe.dedupe_grouped(iter(signatures), log=log):
+            pass
+    elif method == 'grouped_global':
+        for _ in dedupe.dedupe_global(dedupe.dedupe_grouped(iter(signatures), log=log), log=log):
+            pass
+    elif method == 'sharded':
+        for _ in dedupe.dedupe_sharded(inputs['names'], workers, False, False, 'video', log=log):
+            pass
+    elif method == 'store':
+        _store_run(flat, log)
+    elif method == 'hash':
+        _hash(inputs['hashes'], log, int(threshold), inputs['hash_bits'])
+
+
+def score(log, truth):
+    """Precision and recall of the duplicate decisions against the source slides"""
+    decided = [(name, representative) for name, representative in log.parent.items()
+               if representative is not None]
+    correct = sum(truth[name] == truth[representative] for name, representative in decided)
+    redundant = len(truth) - len(set(truth.values()))
+    precision = correct / len(decided) if decided else 1.0
+    recall = correct / redundant if redundant else 1.0
+    digest = hashlib.sha1(repr(sorted(decided)).encode('utf-8')).hexdigest()[:12]
+    return precision, recall, len(log.parent) - len(decided), digest
+
+
+def compare(results, baseline):
+    """Print changes against a previous run; return changed results and slowdowns"""
+    previous = {(r['method'], r['threshold']): r for r in baseline['results']}
+    problems = []
+    for result in results:
+        before = previous.get((result['method'], result['threshold']))
+        if before is None:
+            continue
+        key = f"{result['method']}@{result['threshold']}"
+        if before['decisions'] != result['decisions']:
+            print(f"  {key:22} decisions changed: precision {before['precision']:.3f} -> "
+                  f"{result['precision']:.3f}, recall {before['recall']:.3f} -> {result['recall']:.3f}")
+            problems.append((key, 'decisions'))
+        change = (result['images_per_second'] - before['images_per_second']) / before['images_per_second']
+        flag = ''
+        if -change > REGRESSION_TOLERANCE:
+            flag = '  <-- regression'
+            problems.append((key, 'images_per_second'))
+        print(f"  {key:22} {before['images_per_second']:>9.1f} -> "
+              f"{result['images_per_second']:>9.1f} images/s ({change:+.1%}){flag}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dedupe accuracy and throughput')
+    parser.add_argument('--videos', type=int, default=2)
+    parser.add_argument('--slides', type=int, default=12, help='source slides per video')
+    parser.add_argument('--variants', type=int, default=5, help='near-duplicates per slide')
+    parser.add_argument('--revisit', type=float, default=0.2,
+                        help='chance that an earlier slide is shown again')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=METHODS)
+    parser.add_argument('--thresholds', nargs='+', type=float, default=[0.90, 0.93, 0.95, 0.97],
+                        help='SSIM thresholds for the SSIM methods')
+    parser.add_argument('--radii', nargs='+', type=int, default=[0, 4, 8, 16, 32],
+                        help='Hamming radii for the hash method')
+    parser.add_argument('--hash-size', type=int, default=16,
+                        help='average_hash size for the hash method')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='worker processes for the sharded method')
+    parser.add_argument('--work-dir', help='fixture folder (default: a temp folder)')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='previous results JSON to compare against')
+    args = parser.parse_args()
+
+    from frame_extraction import hash_frame
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bench_dedupe_')
+    fixture_dir = os.path.join(work_dir, 'frames')
+    truth = make_fixture(fixture_dir, args.videos, args.slides, args.variants,
+                         args.revisit, args.width, args.height)
+    names = sorted(truth, key=dedupe.frame_order)
+    print(f"{len(names)} frames from {len(set(truth.values()))} slides in {fixture_dir}")
+
+    dedupe.input_folder = fixture_dir
+    dedupe.output_folder = os.path.join(work_dir, 'out')
+    started = time.perf_counter()
+    signatures = list(dedupe.load_signatures(names))
+    decode_rate = len(names) / (time.perf_counter() - started)
+    started = time.perf_counter()
+    hashes = [(name, int(hash_frame(cv2.imread(os.path.join(fixture_dir, name)), args.hash_size), 16))
+              for name in names]
+    hash_rate = len(names) / (time.perf_counter() - started)
+    # images/s below excludes this per-image preparation, which every run repeats
+    # (except for 'sharded', which decodes its inputs itself). The original
+    # script also decoded both images for every comparison, which 'original'
+    # leaves out; it only reproduces the original's decisions.
+    print(f"Signature decode: {decode_rate:.1f} images/s, frame hashing: {hash_rate:.1f} images/s")
+    inputs = {
+        'names': names,
+        'signatures': signatures,
+        # dedupe() without grouping takes the frames in file-name order
+        'flat': sorted(signatures, key=lambda item: item[0]),
+        'original': [(name, original_signature(os.path.join(fixture_dir, name)))
+                     for name in sorted(names)],
+        'hashes': hashes,
+        'hash_bits': args.hash_size * args.hash_size,
+    }
+
+    results = []
+    print(f"{'method':15} {'threshold':>9} {'images/s':>9} {'compares':>9} "
+          f"{'uniques':>7} {'precision':>9} {'recall':>7}  same as original")
+    for method in args.methods:
+        for threshold in (args.radii if method == 'hash' else args.thresholds):
+            log, seconds, comparisons = run_method(method, threshold, inputs, args.workers)
+            precision, recall, uniques, digest = score(log, truth)
+            if method == 'sharded':
+                single_log, _, _ = run_method(method, threshold, inputs, 1)
+                if score(single_log, truth)[3] != digest:
+                    print(f"Warning: sharded decisions at {threshold} differ between "
+                          f"{args.workers} workers and 1")
+            result = {
+                'method': method,
+                'threshold': threshold,
+                'images_per_second': round(len(names) / seconds, 2),
+                'comparisons': comparisons,
+                'uniques': uniques,
+                'precision': round(precision, 4),
+                'recall': round(recall, 4),
+                'decisions': digest
+            }
+            results.append(result)
+            same = '-'
+            original = next((r for r in results if r['method'] == 'original'
+                             and r['threshold'] == threshold), None)
+            if method not in ('original', 'hash') and original is not None:
+                same = 'yes' if original['decisions'] == digest else 'NO'
+            print(f"{method:15} {threshold:>9} {result['images_per_second']:>9.1f} "
+                  f"{comparisons if comparisons is not None else '-':>9} {uniques:>7} "
+                  f"{precision:>9.3f} {recall:>7.3f}  {same}")
+
+    differing = sorted({(r['method'], r['threshold']) for r in results
+                        for o in results
+                        if o['method'] == 'original' and r['method'] not in ('original', 'hash')
+                        and o['threshold'] == r['threshold'] and o['decisions'] != r['decisions']})
+    if differing:
+        print("Decisions that differ from the original script: " +
+              ', '.join(f"{method}@{threshold}" for method, threshold in differing))
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'fixture': {
+            'videos': args.videos, 'slides': args.slides, 'variants': args.variants,
+            'revisit': args.revisit, 'width': args.width, 'height': args.height,
+            'hash_size': args.hash_size
+        },
+        'decode_images_per_second': round(decode_rate, 2),
+        'hash_images_per_second': round(hash_rate, 2),
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('fixture') != report['fixture']:
+            print("Warning: the baseline used a different fixture")
+        print(f"Compared with {args.compare}:")
+        problems = compare(results, baseline)
+        if problems:
+            print(f"{len(problems)} change(s) or regression(s)")
+            sys.exit(1)
+
+    if not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
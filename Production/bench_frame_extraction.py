@@ -0,0 +1,371 @@
+# Benchmarks the frame stage on synthetic videos so extraction changes can be
+# measured instead of judged by eye.
+#
+#   python bench_frame_extraction.py --duration 600 --output run.json
+#   python bench_frame_extraction.py --duration 600 --compare run.json
+#
+# Every strategy runs in a fresh process so its peak RSS is its own.
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from datetime import datetime
+import cv2
+import numpy as np
+
+STRATEGIES = ['legacy', 'keyframe_seek', 'sequential', 'pipeline', 'scene']
+
+# A strategy is flagged when it gets this much slower or hungrier
+REGRESSION_TOLERANCE = 0.10
+
+
+def make_slide(rng, width, height):
+    """Draw a chart-like frame: dark background, grid and random candlesticks"""
+    frame = np.full((height, width, 3), int(rng.integers(10, 40)), np.uint8)
+    for x in range(0, width, max(1, width // 12)):
+        cv2.line(frame, (x, 0), (x, height), (60, 60, 60), 1)
+    for y in range(0, height, max(1, height // 8)):
+        cv2.line(frame, (0, y), (width, y), (60, 60, 60), 1)
+
+    price = height / 2
+    candle_width = max(2, width // 80)
+    for x in range(candle_width, width - candle_width, candle_width * 2):
+        move = rng.normal(0, height / 40)
+        open_price, close_price = price, min(height - 5, max(5, price + move))
+        high = min(open_price, close_price) - abs(rng.normal(0, height / 60))
+        low = max(open_price, close_price) + abs(rng.normal(0, height / 60))
+        color = (80, 200, 80) if close_price < open_price else (80, 80, 220)
+        center = x + candle_width // 2
+        cv2.line(frame, (center, int(high)), (center, int(low)), color, 1)
+        cv2.rectangle(frame, (x, int(min(open_price, close_price))),
+                      (x + candle_width, int(max(open_price, close_price))), color, -1)
+        price = close_price
+    return frame
+
+
+def make_fixture(directory, duration, width, height, fps, slide_seconds, entry_seconds, seed=0):
+    """Write a synthetic video and a matching [MM:SS] transcript; return both paths"""
+    os.makedirs(directory, exist_ok=True)
+    video_path = os.path.join(directory, 'bench.mp4')
+    transcript_path = os.path.join(directory, 'bench.txt')
+    rng = np.random.default_rng(seed)
+
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open a VideoWriter for {video_path}")
+    frames_per_slide = max(1, int(round(slide_seconds * fps)))
+    slide = None
+    for index in range(int(duration * fps)):
+        if index % frames_per_slide == 0:
+            slide = make_slide(rng, width, height)
+        frame = slide.copy()
+        # A moving cursor keeps consecutive frames from being byte-identical
+        cursor = (int(index * 7) % width, int(index * 3) % height)
+        cv2.circle(frame, cursor, 4, (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+    # Same layout Pull_scripts_UtubeAs_IDID.py writes, minutes may overflow 99
+    with open(transcript_path, 'w', encoding='utf-8') as f:
+        for second in range(0, int(duration), entry_seconds):
+            f.write(f"[{second // 60:02d}:{second % 60:02d}] caption at {second} seconds ")
+    return video_path, transcript_path
+
+
+COUNTS = {'opens': 0, 'seeks': 0, 'grabs': 0, 'retrieves': 0}
+
+
+class CountingCapture:
+    """cv2.VideoCapture proxy counting opens, seeks, grabs and retrieves"""
+    _capture_class = cv2.VideoCapture
+
+    def __init__(self, *args, **kwargs):
+        self._capture = self._capture_class(*args, **kwargs)
+        COUNTS['opens'] += 1
+
+    def set(self, prop, value):
+        if prop in (cv2.CAP_PROP_POS_MSEC, cv2.CAP_PROP_POS_FRAMES):
+            COUNTS['seeks'] += 1
+        return self._capture.set(prop, value)
+
+    def read(self):
+        COUNTS['grabs'] += 1
+        COUNTS['retrieves'] += 1
+        return self._capture.read()
+
+    def grab(self):
+        COUNTS['grabs'] += 1
+        return self._capture.grab()
+
+    def retrieve(self, *args):
+        COUNTS['retrieves'] += 1
+        return self._capture.retrieve(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._capture, name)
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process, or None if it can't be read"""
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        peak = getattr(info, 'peak_wset', None)  # Windows
+        if peak:
+            return peak
+    except ImportError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def folder_bytes(folder):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(folder) for name in names
+    )
+
+
+def read_timestamps(transcript_path):
+    from transcript_parser import iter_transcript
+    return [entry.timestamp for entry in iter_transcript(transcript_path)]
+
+
+def _run_legacy(video_path, transcript_path, out_dir):
+    """The original frame loop: open + seek per entry, write, re-read, hash, copy"""
+    import imagehash
+    from PIL import Image
+    seen = set()
+    frames = 0
+    for timestamp in read_timestamps(transcript_path):
+        cap = cv2.VideoCapture(video_path)
+        cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
+        success, frame = cap.read()
+        cap.release()
+        if not success:
+            continue
+        frames += 1
+        output_path = os.path.join(out_dir, f"bench_{timestamp}.jpg")
+        cv2.imwrite(output_path, frame)
+        with Image.open(output_path) as img:
+            frame_hash = str(imagehash.average_hash(img, hash_size=16))
+        if frame_hash not in seen:
+            seen.add(frame_hash)
+            shutil.copy(output_path, os.path.join(out_dir, f"{frame_hash}.jpg"))
+    return frames
+
+
+def _run_keyframe_seek(video_path, transcript_path, out_dir):
+    from frame_extraction import extract_frame_at, hash_frame
+    seen = set()
+    frames = 0
+    for timestamp in read_timestamps(transcript_path):
+        frame = extract_frame_at(video_path, timestamp)
+        if frame is None:
+            continue
+        frames += 1
+        frame_hash = hash_frame(frame)
+        if frame_hash not in seen:
+            seen.add(frame_hash)
+            cv2.imwrite(os.path.join(out_dir, f"{frame_hash}.jpg"), frame)
+    return frames
+
+
+def _run_sequential(video_path, transcript_path, out_dir):
+    from frame_extraction import extract_frames_sequential, hash_frame
+    seen = set()
+    frames = 0
+    for _, frame in extract_frames_sequential(video_path, read_timestamps(transcript_path)):
+        frames += 1
+        frame_hash = hash_frame(frame)
+        if frame_hash not in seen:
+            seen.add(frame_hash)
+            cv2.imwrite(os.path.join(out_dir, f"{frame_hash}.jpg"), frame)
+    return frames
+
+
+def _run_frame_stage(video_path, transcript_path, out_dir, sampling_mode):
+    """The production frame stage (segments, pipeline, hash index) in out_dir
+
+    Returns the number of frames retrieved; in scene mode that includes every
+    analysis sample, not just the frames kept.
+    """
+    import V4DS1vid3 as frame_stage
+    frame_stage.UNIQUE_FRAMES_DIR = os.path.join(out_dir, 'unique')
+    frame_stage.FRAMES_DIR = os.path.join(out_dir, 'frames')
+    frame_stage.HASH_INDEX_PATH = os.path.join(out_dir, 'hashes.sqlite')
+    frame_stage.MANIFEST_DIR = os.path.join(out_dir, 'manifests')
+    frame_stage.FRAME_CATALOG_PATH = os.path.join(out_dir, 'frame_catalog.sqlite')
+    os.makedirs(frame_stage.UNIQUE_FRAMES_DIR, exist_ok=True)
+    scratch_dir = tempfile.mkdtemp(dir=out_dir)
+    try:
+        frame_stage.extract_unique_frames(
+            transcript_path, video_path, 'bench', scratch_dir,
+            hash_first=True, keep_raw_frames=False, sampling_mode=sampling_mode
+        )
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return COUNTS['retrieves']
+
+
+def _run_pipeline(video_path, transcript_path, out_dir):
+    return _run_frame_stage(video_path, transcript_path, out_dir, 'transcript')
+
+
+def _run_scene(video_path, transcript_path, out_dir):
+    return _run_frame_stage(video_path, transcript_path, out_dir, 'scene')
+
+
+RUNNERS = {
+    'legacy': _run_legacy,
+    'keyframe_seek': _run_keyframe_seek,
+    'sequential': _run_sequential,
+    'pipeline': _run_pipeline,
+    'scene': _run_scene,
+}
+
+
+def _strategy_worker(strategy, video_path, transcript_path, out_dir, result_queue):
+    """Child-process entry point: run one strategy and report its measurements"""
+    try:
+        cv2.VideoCapture = CountingCapture
+        started = time.perf_counter()
+        frames = RUNNERS[strategy](video_path, transcript_path, out_dir)
+        elapsed = time.perf_counter() - started
+        result_queue.put({
+            'strategy': strategy,
+            'frames': frames,
+            'seconds': round(elapsed, 4),
+            'frames_per_second': round(frames / elapsed, 2) if elapsed else None,
+            'opens': COUNTS['opens'],
+            'seeks': COUNTS['seeks'],
+            'grabs': COUNTS['grabs'],
+            'retrieves': COUNTS['retrieves'],
+            'bytes_written': folder_bytes(out_dir),
+            'peak_rss_bytes': peak_rss_bytes()
+        })
+    except Exception as e:
+        result_queue.put({'strategy': strategy, 'error': f"{type(e).__name__}: {e}"})
+
+
+def run_strategy(strategy, video_path, transcript_path, work_dir):
+    out_dir = os.path.join(work_dir, f"out_{strategy}")
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    context = multiprocessing.get_context('spawn')
+    result_queue = context.Queue()
+    process = context.Process(
+        target=_strategy_worker,
+        args=(strategy, video_path, transcript_path, out_dir, result_queue)
+    )
+    process.start()
+    result = result_queue.get()
+    process.join()
+    return result
+
+
+def compare(results, baseline):
+    """Print per-strategy changes against a previous run; return regressions"""
+    previous = {r['strategy']: r for r in baseline['results'] if 'error' not in r}
+    regressions = []
+    for result in results:
+        before = previous.get(result['strategy'])
+        if 'error' in result or before is None:
+            continue
+        lines = []
+        for metric, higher_is_better in [('frames_per_second', True),
+                                         ('peak_rss_bytes', False),
+                                         ('bytes_written', False),
+                                         ('seeks', False)]:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > REGRESSION_TOLERANCE:
+                flag = '  <-- regression'
+                regressions.append((result['strategy'], metric, old, new))
+            lines.append(f"    {metric:18} {old:>14,.1f} -> {new:>14,.1f} ({change:+.1%}){flag}")
+        print(f"  {result['strategy']}")
+        print('\n'.join(lines))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark frame extraction strategies')
+    parser.add_argument('--duration', type=int, default=300, help='video length in seconds')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--slide-seconds', type=float, default=20,
+                        help='seconds between slide/chart changes')
+    parser.add_argument('--entry-seconds', type=int, default=3,
+                        help='seconds between transcript entries')
+    parser.add_argument('--strategies', nargs='+', choices=STRATEGIES, default=STRATEGIES)
+    parser.add_argument('--work-dir', help='fixture/output folder (default: a temp folder)')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='previous results JSON to compare against')
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bench_frames_')
+    print(f"Generating {args.duration}s {args.width}x{args.height} fixture in {work_dir}")
+    video_path, transcript_path = make_fixture(
+        os.path.join(work_dir, 'fixture'), args.duration, args.width, args.height,
+        args.fps, args.slide_seconds, args.entry_seconds
+    )
+
+    results = []
+    for strategy in args.strategies:
+        result = run_strategy(strategy, video_path, transcript_path, work_dir)
+        results.append(result)
+        if 'error' in result:
+            print(f"{strategy:14} failed: {result['error']}")
+        else:
+            rss = result['peak_rss_bytes']
+            print(f"{strategy:14} {result['frames_per_second']:>9} frames/s  "
+                  f"{result['seeks']:>6} seeks  {result['bytes_written']:>12,} bytes  "
+                  f"peak RSS {rss / 2**20 if rss else float('nan'):.0f} MiB")
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'opencv': cv2.__version__,
+        'fixture': {
+            'duration': args.duration, 'width': args.width, 'height': args.height,
+            'fps': args.fps, 'slide_seconds': args.slide_seconds,
+            'entry_seconds': args.entry_seconds
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('fixture') != report['fixture']:
+            print("Warning: the baseline used a different fixture")
+        print(f"Compared with {args.compare}:")
+        regressions = compare(results, baseline)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {REGRESSION_TOLERANCE:.0%}")
+            sys.exit(1)
+
+    if not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+# Benchmarks transcript_parser against the regex the pipeline scripts used to
+# copy around, on synthetic multi-megabyte transcripts.
+#
+#   python bench_transcript_parser.py --megabytes 20
+#
+# Transcripts follow the layout Pull_scripts_UtubeAs_IDID.py writes: one line of
+# "[MM:SS] text " entries, with minutes running past 99 on long videos.
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+
+from transcript_parser import iter_transcript
+from bench_frame_extraction import peak_rss_bytes
+
+WORDS = ['price', 'support', 'resistance', 'liquidity', 'gap', 'order', 'block', 'the',
+         'we', 'look', 'at', 'this', 'candle', 'high', 'low', 'into', 'premium', 'discount']
+
+
+def make_transcript(path, megabytes, wrap_minutes=None, seed=0):
+    """Write about `megabytes` MB of transcript; return the number of entries
+
+    With wrap_minutes the clock restarts at 00:00 after that many minutes, so
+    every stamp keeps two minute digits.
+    """
+    rng = np.random.default_rng(seed)
+    target = megabytes * 2**20
+    written = 0
+    entries = 0
+    second = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < target:
+            text = ' '.join(rng.choice(WORDS, size=int(rng.integers(4, 16))))
+            shown = second % (wrap_minutes * 60) if wrap_minutes else second
+            chunk = f"[{shown // 60:02d}:{shown % 60:02d}] {text} "
+            f.write(chunk)
+            written += len(chunk)
+            entries += 1
+            second += int(rng.integers(1, 6))
+    return entries
+
+
+def legacy_extract(transcript_path):
+    """The regex parser formerly copied into the PDF scripts, kept as reference"""
+    timestamp_pattern = r'\[(\d{2}:\d{2}(?::\d{2})?)\]\s*(.*?)(?=\[|$)'
+    entries = []
+
+    with open(transcript_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+        matches = re.findall(timestamp_pattern, content, re.DOTALL)
+
+        for match in matches:
+            timestamp, text = match
+            time_parts = list(map(int, timestamp.split(':')))
+            total_seconds = sum(
+                part * 60**i for i, part in enumerate(reversed(time_parts))
+            )
+
+            entries.append({
+                'timestamp': total_seconds,
+                'text': text.strip()
+            })
+
+    return entries
+
+
+PARSERS = {
+    'legacy regex': legacy_extract,
+    'transcript_parser': iter_transcript,
+}
+
+
+def _memory_worker(name, path, result_queue):
+    """Child-process entry point: parse once and report how far peak RSS rose"""
+    before = peak_rss_bytes()
+    for _ in PARSERS[name](path):
+        pass
+    after = peak_rss_bytes()
+    result_queue.put(None if before is None or after is None else after - before)
+
+
+def peak_rss_growth(name, path):
+    """Growth of peak resident memory while one parse runs in a fresh process
+
+    Resident memory counts the mapped transcript pages the mmap parser
+    touches, which tracemalloc does not see. Linux carries the peak RSS
+    across the fork and exec that start the child, so this has to run before
+    the calling process itself parses anything large.
+    """
+    context = multiprocessing.get_context('spawn')
+    result_queue = context.Queue()
+    process = context.Process(target=_memory_worker, args=(name, path, result_queue))
+    process.start()
+    growth = result_queue.get()
+    process.join()
+    return growth
+
+
+def measure(parse, path, repeat):
+    """Return (entries, best seconds) for full parses"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = sum(1 for _ in parse(path))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return count, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the transcript parser')
+    parser.add_argument('--megabytes', type=float, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    paths = []
+    for _ in range(2):
+        fd, path = tempfile.mkstemp(suffix='.txt', prefix='bench_transcript_')
+        os.close(fd)
+        paths.append(path)
+    continuous_path, path = paths
+    try:
+        # Memory first, while this process has not parsed anything yet
+        written = make_transcript(path, args.megabytes, wrap_minutes=99)
+        growth = {name: peak_rss_growth(name, path) for name in PARSERS}
+
+        # A continuous clock overflows to [MMM:SS] after 99 minutes, which the
+        # legacy pattern does not match; everything after that is lost
+        continuous = make_transcript(continuous_path, args.megabytes)
+        print(f"Continuous clock: {continuous} entries written, legacy regex finds "
+              f"{len(legacy_extract(continuous_path))}, transcript_parser finds "
+              f"{sum(1 for _ in iter_transcript(continuous_path))}")
+
+        # Speed and memory on stamps both parsers understand
+        size = os.path.getsize(path)
+        new = [(e.timestamp, e.text) for e in iter_transcript(path)]
+        old = [(e['timestamp'], e['text']) for e in legacy_extract(path)]
+        print(f"{size / 2**20:.1f} MB transcript, {written} two-digit entries, "
+              f"parsers agree: {new == old}")
+        del new, old
+
+        for name, parse in PARSERS.items():
+            count, best = measure(parse, path, args.repeat)
+            memory = 'n/a' if growth[name] is None else f"{growth[name] / 2**20:.1f} MiB"
+            print(f"{name:18} {count:>9} entries  {size / 2**20 / best:>7.1f} MB/s  "
+                  f"peak RSS growth {memory:>10}")
+    finally:
+        for path in paths:
+            os.remove(path)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# Duplicate-cluster manifests: which frames were folded into which unique frame
+import os
+import csv
+import json
+from file_utils import atomic_write
+
+CSV_FIELDS = ['representative', 'member', 'score']
+
+
+class ClusterLog:
+    """Collects representative/member decisions made while deduping
+
+    Every input is recorded either as a unique or as a duplicate of an
+    earlier frame, with its similarity score. A representative that is itself
+    later folded into another one (e.g. by a merge phase) takes its members
+    along, so clusters() always groups members under their final unique.
+    Logs from worker processes can be merged with update().
+    """
+
+    def __init__(self):
+        self.parent = {}
+        self.scores = {}
+
+    def add_unique(self, name):
+        self.parent.setdefault(name, None)
+        self.scores.setdefault(name, 1.0)
+
+    def add_duplicate(self, name, representative, score):
+        self.parent[name] = representative
+        self.scores[name] = float(score)
+
+    def forget(self, name):
+        """Drop the decision recorded for name, e.g. before deciding it again"""
+        self.parent.pop(name, None)
+        self.scores.pop(name, None)
+
+    def update(self, other):
+        for name, representative in other.parent.items():
+            if representative is not None or name not in self.parent:
+                self.parent[name] = representative
+                self.scores[name] = other.scores[name]
+
+    def _root(self, name):
+        seen = set()
+        while self.parent.get(name) is not None and name not in seen:
+            seen.add(name)
+            name = self.parent[name]
+        return name
+
+    def clusters(self):
+        """Return {representative: [(member, score)]}, the representative first"""
+        clusters = {}
+        for name in self.parent:
+            root = self._root(name)
+            clusters.setdefault(root, [])
+            if name == root:
+                clusters[root].insert(0, (name, self.scores[name]))
+            else:
+                clusters[root].append((name, self.scores[name]))
+        return clusters
+
+
+def read_cluster_manifest(path):
+    """Load {representative: [(member, score)]} from a .json or .csv manifest"""
+    clusters = {}
+    if not os.path.exists(path):
+        return clusters
+    if path.lower().endswith('.csv'):
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                clusters.setdefault(row['representative'], []).append(
+                    (row['member'], float(row['score'])))
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            for representative, members in json.load(f).items():
+                clusters[representative] = [(m['member'], m['score']) for m in members]
+    return clusters
+
+
+def write_cluster_manifest(path, clusters, merge=False):
+    """Write clusters as CSV or JSON (by extension), atomically
+
+    With merge, members already recorded in the existing manifest are kept
+    and the new ones are added to their representative's cluster.
+    """
+    if merge:
+        combined = read_cluster_manifest(path)
+        for representative, members in clusters.items():
+            known = {member for member, _ in combined.get(representative, [])}
+            combined.setdefault(representative, []).extend(
+                (member, score) for member, score in members if member not in known)
+        clusters = combined
+
+    if path.lower().endswith('.csv'):
+        with atomic_write(path, newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDS)
+            for representative, members in clusters.items():
+                for member, score in members:
+                    writer.writerow([representative, member, f"{score:.6f}"])
+    else:
+        with atomic_write(path) as f:
+            json.dump({representative: [{'member': member, 'score': round(score, 6)}
+                                        for member, score in members]
+                       for representative, members in clusters.items()}, f, indent=1)
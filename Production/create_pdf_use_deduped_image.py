@@ -1,5 +1,4 @@
 import os
-import re
 import cv2
 import hashlib
 from datetime import datetime
@@ -16,6 +15,8 @@ from reportlab.platypus import (
 )
 import shutil
 import imagehash
+from frame_extraction import extract_frames_sequential
+from transcript_parser import read_transcript
 
 # Updated directories with 'T' suffix
 BASE_DIR = r'D:\\AI_train_data\\Train_Prod'
@@ -25,45 +26,6 @@ FRAMES_DIR = os.path.join(BASE_DIR, 'framesT')
 UNIQUE_FRAMES_DIR = os.path.join(BASE_DIR, 'unique_framesT')
 PDF_OUTPUT_DIR = os.path.join(BASE_DIR, 'pdf_outputT')
 
-def extract_timestamps_and_text(transcript_path):
-    """Extract timestamps and associated text with improved regex"""
-    timestamp_pattern = r'\[(\d{2}:\d{2}(?::\d{2})?)\]\s*(.*?)(?=\[|$)'
-    entries = []
-    
-    with open(transcript_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-        matches = re.findall(timestamp_pattern, content, re.DOTALL)
-        
-        for match in matches:
-            timestamp, text = match
-            time_parts = list(map(int, timestamp.split(':')))
-            total_seconds = sum(
-                part * 60**i for i, part in enumerate(reversed(time_parts))
-            )
-            
-            entries.append({
-                'timestamp': total_seconds,
-                'text': text.strip()
-            })
-    
-    return entries
-
-def extract_frame(video_path, timestamp_seconds, output_path):
-    """Extracts frame at specified timestamp using OpenCV with error handling"""
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print(f"Error opening video: {video_path}")
-        return False
-    
-    cap.set(cv2.CAP_PROP_POS_MSEC, timestamp_seconds * 1000)
-    success, frame = cap.read()
-    
-    if success:
-        cv2.imwrite(output_path, frame)
-        return True
-    print(f"Failed to extract frame at {timestamp_seconds}s from {video_path}")
-    return False
-
 def parse_session_time(timestamp):
     """Convert timestamp to trading session context"""
     hour = (timestamp // 3600) % 24
@@ -87,31 +49,36 @@ def process_video_transcript_pair(transcript_file, video_file):
     # Process timestamps and text
     transcript_path = os.path.join(TRANSCRIPT_DIR, transcript_file)
     video_path = os.path.join(VIDEO_DIR, video_file)
-    entries = extract_timestamps_and_text(transcript_path)
+    entries = read_transcript(transcript_path)
     
-    unique_entries = {}
+    # Group entries by second so every frame is decoded once, in one pass
+    texts_by_timestamp = {}
     for entry in entries:
+        texts_by_timestamp.setdefault(entry.timestamp, []).append(entry.text)
+
+    unique_entries = {}
+    for timestamp, frame in extract_frames_sequential(video_path, texts_by_timestamp):
         try:
-            frame_filename = f"{base_name}_{entry['timestamp']}.jpg"
+            frame_filename = f"{base_name}_{timestamp}.jpg"
             output_path = os.path.join(FRAMES_DIR, base_name, frame_filename)
-            
-            if extract_frame(video_path, entry['timestamp'], output_path):
-                with Image.open(output_path) as img:
-                    frame_hash = str(imagehash.average_hash(img, hash_size=16))
-                    
-                unique_path = os.path.join(UNIQUE_FRAMES_DIR, f"{frame_hash}.jpg")
-                if frame_hash not in unique_entries:
-                    shutil.copy(output_path, unique_path)
-                    unique_entries[frame_hash] = {
-                        'image_path': unique_path,
-                        'texts': [entry['text']],
-                        'timestamp': entry['timestamp']
-                    }
-                else:
-                    unique_entries[frame_hash]['texts'].append(entry['text'])
-                    
+            cv2.imwrite(output_path, frame)
+
+            with Image.open(output_path) as img:
+                frame_hash = str(imagehash.average_hash(img, hash_size=16))
+
+            unique_path = os.path.join(UNIQUE_FRAMES_DIR, f"{frame_hash}.jpg")
+            if frame_hash not in unique_entries:
+                shutil.copy(output_path, unique_path)
+                unique_entries[frame_hash] = {
+                    'image_path': unique_path,
+                    'texts': list(texts_by_timestamp[timestamp]),
+                    'timestamp': timestamp
+                }
+            else:
+                unique_entries[frame_hash]['texts'].extend(texts_by_timestamp[timestamp])
+
         except Exception as e:
-            print(f"Error processing {entry['timestamp']}: {str(e)}")
+            print(f"Error processing {timestamp}: {str(e)}")
             continue
 #adding the nest 4 lines for debugging
 print(f"Processing {len(image_entries)} unique chart patterns")
@@ -1,53 +1,479 @@
-@This program dumps all the .jpg files in one directory and does not compare the images by group
+# This program dumps all the .jpg files in one directory. By default every image is
+# compared against all earlier uniques; with GROUPED it only compares frames of the
+# same video that are close in time, optionally followed by a global pass.
 import os
+import re
 import cv2
 import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from skimage.metrics import structural_similarity as ssim
 import numpy as np
+from PIL import Image
+from hash_index import BKTree
+from batched_ssim import BatchedSSIM
+from signature_store import SignatureStore
+from cluster_manifest import ClusterLog, write_cluster_manifest
+from file_utils import link_or_copy
+from frame_catalog import FrameCatalog, describe_image
+from frame_store import FrameStore
 
 # Input and output folders
 input_folder = r"D:\AI_train_data\Train_Prod\unique_frames"
 output_folder = r"D:\AI_train_data\Train_Prod\unique_framesT3round"
 
-# Ensure output directory exists
-os.makedirs(output_folder, exist_ok=True)
+SSIM_THRESHOLD = 0.95  # Adjust threshold as needed
+SIGNATURE_SIZE = 256  # images are compared as 256x256 grayscale
+# Decode JPEGs in PIL's draft mode, scaled down and luma-only inside libjpeg,
+# instead of a full color decode, resize and grayscale conversion. It is much
+# faster on large frames, but the signatures differ slightly and change some
+# decisions near SSIM_THRESHOLD, so it is off unless a run opts in.
+DRAFT_DECODE = False
+
+# Candidate prefilter: a 64-bit average hash of the 256x256 grayscale image.
+# SSIM only runs against the PREFILTER_CANDIDATES unique images whose hash is
+# nearest and within PREFILTER_RADIUS bits, instead of against every unique.
+PREFILTER_RADIUS = 12
+PREFILTER_CANDIDATES = 8
+
+# Grouped temporal mode: frames named <video_id>_<seconds>.jpg are processed per
+# video in time order and compared only against the last GROUP_WINDOW uniques of
+# the same video, so the cost is O(n * GROUP_WINDOW) and memory stays bounded.
+# GLOBAL_PASS then runs the all-uniques comparison over the grouped survivors.
+GROUPED = False
+GROUP_WINDOW = 8
+GLOBAL_PASS = False
+FRAME_NAME_PATTERN = re.compile(r'^(.+)_(\d+)\.jpg$', re.IGNORECASE)
+
+# Sharded mode (SHARD_BY = 'video'): the inputs are split into one shard per
+# video id (from the name or the frame catalog), plus one shard for frames of
+# no known video. Each shard is deduped on its own, in a worker process when
+# DEDUPE_WORKERS > 1, and a merge phase compares the shard uniques in input
+# order. The result depends on the sharding, not on the number of workers; it
+# can differ from one unsharded pass because SSIM similarity is not
+# transitive. None runs the single global pass.
+DEDUPE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+SHARD_BY = None
+
+# Accepted signatures persist between runs in a memory-mapped store next to the
+# output folder (<output_folder>.signatures unless SIGNATURE_STORE_DIR is set).
+# A new run skips inputs it has already processed and compares new ones
+# against the stored uniques without decoding them again.
+PERSISTENT_SIGNATURES = True
+SIGNATURE_STORE_DIR = None
+
+# Uniques are materialized in output_folder by hardlink, then symlink, then
+# copy, whichever the filesystem allows first. Which inputs were folded into
+# which unique (with SSIM scores) is recorded in <output_folder>.clusters.<fmt>,
+# 'json' or 'csv', merged across runs.
+MATERIALIZE_MODES = ('hardlink', 'symlink', 'copy')
+CLUSTER_MANIFEST_FORMAT = 'json'
+
+# Frame catalog written by V4DS1vid3 (see frame_catalog.py). Input frames it
+# lists are placed on their video's timeline from it, so grouped mode and video
+# shards also work for hash-named frames, and the uniques are registered under
+# output_folder for the later stages. None disables the catalog.
+FRAME_CATALOG_PATH = r"D:\AI_train_data\Train_Prod\frame_catalog.sqlite"
+
+# (video_id, seconds) of input files according to the frame catalog, by name
+frame_positions = {}
+
+def load_signature(image_path):
+    """Decode an image once into its 256x256 grayscale SSIM signature
+
+    By default the image is read in color, resized and converted to
+    grayscale, as the original comparison did. With DRAFT_DECODE, JPEGs are
+    decoded in PIL's draft mode, which lets libjpeg scale by 1/2, 1/4 or 1/8
+    while decoding (never below 256 px) and return the luma plane directly.
+    """
+    if not DRAFT_DECODE:
+        image = cv2.resize(cv2.imread(image_path), (SIGNATURE_SIZE, SIGNATURE_SIZE))
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    with Image.open(image_path) as img:
+        img.draft('L', (SIGNATURE_SIZE, SIGNATURE_SIZE))
+        gray = np.asarray(img.convert('L'))
+    return cv2.resize(gray, (SIGNATURE_SIZE, SIGNATURE_SIZE))
 
 def is_duplicate(image1_path, image2_path):
-    """Compare two images using SSIM while keeping color information."""
-    img1 = cv2.imread(image1_path)  # Read in COLOR
-    img2 = cv2.imread(image2_path)  # Read in COLOR
+    """Compare two images using SSIM on their grayscale signatures"""
+    similarity = ssim(load_signature(image1_path), load_signature(image2_path))
+    return similarity > SSIM_THRESHOLD
+
+def input_path(filename, folder=None):
+    """Path of an input frame, stored flat or in FrameStore's hash-prefix shards"""
+    folder = folder or input_folder
+    return FrameStore(folder).resolve(filename) or os.path.join(folder, filename)
+
+def parse_frame_name(filename):
+    """Return (video_id, seconds) from the frame catalog or from
+    <video_id>_<seconds>.jpg, or (None, None)"""
+    if filename in frame_positions:
+        return frame_positions[filename]
+    match = FRAME_NAME_PATTERN.match(filename)
+    if not match:
+        return None, None
+    return match.group(1), int(match.group(2))
+
+def frame_order(filename):
+    """Sort key grouping frames by video and then by numeric timestamp
+
+    Names without a video id and timestamp sort after all videos, by name,
+    and are treated as one group of their own.
+    """
+    video_id, seconds = parse_frame_name(filename)
+    if video_id is None:
+        return (1, '', 0, filename)
+    return (0, video_id, seconds, filename)
+
+class SignatureSet:
+    """Signatures of the accepted unique images, stacked in one contiguous array
+
+    Rows are appended in acceptance order and the backing array doubles when
+    full, so comparisons index into memory instead of re-reading JPEGs.
+    """
+
+    def __init__(self, capacity=1024):
+        self.array = np.empty((capacity, SIGNATURE_SIZE, SIGNATURE_SIZE), np.uint8)
+        self.names = []
+        self.hashes = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def add(self, name, signature, frame_hash=None):
+        """Append a signature (and its thumbnail hash) and return its row index"""
+        index = len(self.names)
+        if index == len(self.array):
+            grown = np.empty((2 * len(self.array),) + self.array.shape[1:], np.uint8)
+            grown[:index] = self.array
+            self.array = grown
+        self.array[index] = signature
+        self.names.append(name)
+        self.hashes.append(frame_hash)
+        return index
+
+def thumbnail_hash(gray):
+    """64-bit average hash of a grayscale image, as an int"""
+    small = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA)
+    bits = (small > small.mean()).flatten()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+def find_candidates(index, frame_hash):
+    """Row indices of the nearest unique images by thumbnail hash, closest first"""
+    matches = sorted(index.search(frame_hash, PREFILTER_RADIUS))
+    return [row for _, row in matches[:PREFILTER_CANDIDATES]]
+
+def load_signatures(image_files, folder=None):
+    """Yield (filename, signature) for each image, decoding it exactly once"""
+    for filename in image_files:
+        yield filename, load_signature(input_path(filename, folder))
+
+def dedupe_global(signatures, uniques=None, log=None):
+    """Yield each (filename, signature) that is not a duplicate of an earlier unique
+
+    Uniques are kept in an in-memory SignatureSet, or in the given
+    SignatureStore whose earlier rows count as uniques too. The hash prefilter
+    picks the candidates, which are all scored in one BatchedSSIM call.
+    Decisions are recorded in the optional ClusterLog.
+    """
+    uniques = SignatureSet() if uniques is None else uniques
+    index = BKTree()
+    for row, frame_hash in enumerate(uniques.hashes):
+        if frame_hash is not None:  # a SignatureStore row whose unique was deleted
+            index.add(frame_hash, row)
+    engine = BatchedSSIM(uniques)
+
+    for filename, signature in signatures:
+        frame_hash = thumbnail_hash(signature)
+        row, score = engine.best_match(signature, find_candidates(index, frame_hash))
+        if score > SSIM_THRESHOLD:
+            print(f"Duplicate found: {filename} (similar to {uniques.names[row]})")
+            if log is not None:
+                log.add_duplicate(filename, uniques.names[row], score)
+            continue
+        index.add(frame_hash, uniques.add(filename, signature, frame_hash))
+        if log is not None:
+            log.add_unique(filename)
+        yield filename, signature
+
+def dedupe_grouped(signatures, window=None, log=None):
+    """Yield the uniques of a stream ordered by frame_order, comparing within videos
+
+    Each frame is compared only against the last `window` uniques of its own
+    video. Signatures of a finished video are dropped when the next one
+    starts, so the stream is processed with constant memory.
+    """
+    window = window or GROUP_WINDOW
+    references = {}
+    names = {}
+    engine = BatchedSSIM(references)
+    recent = deque()
+    current_video = None
+    next_key = 0
+
+    def forget(key):
+        engine.discard(key)
+        del references[key]
+        del names[key]
+
+    for filename, signature in signatures:
+        video_id, _ = parse_frame_name(filename)
+        if video_id != current_video:
+            while recent:
+                forget(recent.popleft())
+            current_video = video_id
+
+        key, score = engine.best_match(signature, reversed(recent))
+        if score > SSIM_THRESHOLD:
+            print(f"Duplicate found: {filename} (similar to {names[key]})")
+            if log is not None:
+                log.add_duplicate(filename, names[key], score)
+            continue
+
+        references[next_key] = signature
+        names[next_key] = filename
+        recent.append(next_key)
+        next_key += 1
+        if len(recent) > window:
+            forget(recent.popleft())
+        if log is not None:
+            log.add_unique(filename)
+        yield filename, signature
+
+def shard_key(filename, shard_by):
+    """Shard of an input file: its video id, or '' without sharding
+
+    Files of no known video share the '' shard. Hash names are not split by
+    prefix, as frames with nearby hashes are no more alike than any others
+    and the merge would have to compare nearly all of them again.
+    """
+    if shard_by is None:
+        return ''
+    if shard_by == 'video':
+        video_id, _ = parse_frame_name(filename)
+        return video_id or ''
+    raise ValueError(f"Unknown shard mode: {shard_by}")
+
+def dedupe_shard(folder, image_files, grouped, work_dir, shard, positions=None):
+    """Dedupe one shard, in a worker process or in-process
+
+    Returns (names of the shard's uniques, path of their signatures, the
+    shard's ClusterLog). The signatures are written to work_dir as raw
+    SIGNATURE_SIZE x SIGNATURE_SIZE rows instead of being pickled back to the
+    parent, which maps them with read_shard_signatures.
+
+    The input folder and the shard's catalog positions are passed explicitly
+    because spawned workers re-import this module with its default settings.
+    """
+    frame_positions.update(positions or {})
+    log = ClusterLog()
+    signatures = load_signatures(image_files, folder)
+    if grouped:
+        uniques = dedupe_grouped(signatures, log=log)
+    else:
+        uniques = dedupe_global(signatures, log=log)
+    names = []
+    path = os.path.join(work_dir, f"shard_{shard}.u8")
+    with open(path, 'wb') as f:
+        for filename, signature in uniques:
+            f.write(np.ascontiguousarray(signature, dtype=np.uint8).tobytes())
+            names.append(filename)
+    return names, path, log
+
+def read_shard_signatures(path, count):
+    """Memory-map the count signatures a dedupe_shard call wrote to path"""
+    if count == 0:
+        return np.empty((0, SIGNATURE_SIZE, SIGNATURE_SIZE), np.uint8)
+    return np.memmap(path, np.uint8, 'r', shape=(count, SIGNATURE_SIZE, SIGNATURE_SIZE))
+
+def dedupe_sharded(image_files, workers, grouped, global_pass, shard_by=None,
+                   uniques=None, log=None):
+    """Return an iterator over the uniques of image_files, deduping them per shard
+
+    Shards are formed from the file names alone (see shard_key) and each is
+    processed in a fixed order, so the result depends on SHARD_BY but never on
+    the worker count: workers=1 runs the same shards in-process. Without
+    sharding, or when the inputs form a single shard, they take the plain
+    streaming path.
+
+    The merge phase feeds all shard uniques, in input order, through the
+    global comparison to drop duplicates that landed in different shards.
+    SSIM similarity is not transitive, so members a shard folded into a
+    unique that the merge then dropped may not resemble any survivor; they
+    are compared again against the final uniques and kept when nothing
+    matches. The merge is skipped for grouped per-video shards without
+    GLOBAL_PASS, where different videos are never compared.
+    """
+    shard_by = shard_by or SHARD_BY
+    order = frame_order if grouped else (lambda filename: filename)
+    image_files = sorted(image_files, key=order)
+
+    shards = {}
+    for filename in image_files:
+        shards.setdefault(shard_key(filename, shard_by), []).append(filename)
+    keys = sorted(shards)
+
+    if len(keys) <= 1:
+        if not grouped:
+            return dedupe_global(load_signatures(image_files), uniques, log)
+        survivors = dedupe_grouped(load_signatures(image_files), log=log)
+        return dedupe_global(survivors, uniques, log) if global_pass else survivors
+    return merge_shards(shards, keys, workers, grouped, global_pass, shard_by, order,
+                        SignatureSet() if uniques is None else uniques,
+                        ClusterLog() if log is None else log)
+
+def merge_shards(shards, keys, workers, grouped, global_pass, shard_by, order, uniques, log):
+    """Dedupe every shard, then yield the uniques of the merge (see dedupe_sharded)"""
+    parent = os.path.dirname(output_folder.rstrip('\\/'))
+    work_dir = tempfile.mkdtemp(prefix='dedupe_shards_',
+                                dir=parent if os.path.isdir(parent) else None)
+    signatures = []
+    try:
+        jobs = [[input_folder] * len(keys), [shards[key] for key in keys],
+                [grouped] * len(keys), [work_dir] * len(keys), list(range(len(keys)))]
+        if workers > 1:
+            positions = [{f: frame_positions[f] for f in shards[key] if f in frame_positions}
+                         for key in keys]
+            with ProcessPoolExecutor(max_workers=min(workers, len(keys))) as pool:
+                results = list(pool.map(dedupe_shard, *jobs, positions))
+        else:
+            results = list(map(dedupe_shard, *jobs))
+
+        for _, _, shard_log in results:
+            log.update(shard_log)
+        signatures = [read_shard_signatures(path, len(names)) for names, path, _ in results]
+        entries = sorted(((name, shard, row) for shard, (names, _, _) in enumerate(results)
+                          for row, name in enumerate(names)), key=lambda entry: order(entry[0]))
+        print(f"Shards: {len(keys)}, shard uniques: {len(entries)} of "
+              f"{sum(len(files) for files in shards.values())}")
+        shard_uniques = ((name, np.array(signatures[shard][row])) for name, shard, row in entries)
+
+        if shard_by == 'video' and grouped and not global_pass:
+            yield from shard_uniques
+            return
+
+        kept = set()
+        for filename, signature in dedupe_global(shard_uniques, uniques, log):
+            kept.add(filename)
+            yield filename, signature
+
+        orphans = sorted((member for _, _, shard_log in results
+                          for representative, members in shard_log.clusters().items()
+                          if representative not in kept
+                          for member, _ in members if member != representative), key=order)
+        if orphans:
+            print(f"Re-checking {len(orphans)} frames whose shard unique was merged away")
+        for filename in orphans:
+            log.forget(filename)
+        yield from dedupe_global(load_signatures(orphans), uniques, log)
+    finally:
+        del signatures
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def signature_store_dir():
+    return SIGNATURE_STORE_DIR or output_folder.rstrip('\\/') + '.signatures'
+
+def cluster_manifest_path():
+    return output_folder.rstrip('\\/') + '.clusters.' + CLUSTER_MANIFEST_FORMAT
+
+def catalog_rows(log, catalog):
+    """Frame catalog rows placing every logged input's times on its unique
+
+    Inputs the catalog lists keep their recorded (video, seconds) entries,
+    others are placed by name; each points at its representative's file in
+    output_folder with the representative's hash.
+    """
+    cataloged = {}
+    for video_id, timestamp, frame_hash, path, _, _, _ in catalog.frames(input_folder):
+        cataloged.setdefault(os.path.basename(path), []).append((video_id, timestamp, frame_hash))
+
+    rows = []
+    for representative, members in log.clusters().items():
+        unique_path = os.path.join(output_folder, representative)
+        if not os.path.exists(unique_path):
+            continue
+        unique_hash = cataloged[representative][0][2] if representative in cataloged else None
+        info = describe_image(unique_path)
+        for member, _ in members:
+            occurrences = cataloged.get(member)
+            if occurrences is None:
+                video_id, seconds = parse_frame_name(member)
+                occurrences = [] if video_id is None else [(video_id, seconds, None)]
+            rows.extend((video_id, seconds, unique_hash, unique_path) + info
+                        for video_id, seconds, _ in occurrences)
+    return rows
+
+def dedupe(image_files, grouped=None, global_pass=None, workers=None, store=None,
+           log=None):
+    """Materialize every image that is not an SSIM duplicate of an earlier unique one
+
+    Each input image is decoded exactly once and streams through the dedupe
+    stages: the global comparison, or the grouped per-video window optionally
+    followed by the global comparison over its survivors. With SHARD_BY the
+    stages run per shard, on a process pool with more than one worker (see
+    dedupe_sharded).
 
-    img1 = cv2.resize(img1, (256, 256))
-    img2 = cv2.resize(img2, (256, 256))
+    With a SignatureStore, inputs processed by an earlier run are skipped and
+    the global comparison also checks the stored uniques; grouped runs without
+    the global pass only record which inputs they processed. Uniques are
+    linked into output_folder (see MATERIALIZE_MODES) and every decision is
+    recorded in the optional ClusterLog.
+    """
+    grouped = GROUPED if grouped is None else grouped
+    global_pass = GLOBAL_PASS if global_pass is None else global_pass
+    workers = DEDUPE_WORKERS if workers is None else workers
 
-    # Convert to grayscale for SSIM comparison
-    img1_gray = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-    img2_gray = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
+    if store is not None:
+        new_files = [f for f in image_files if not store.is_seen(input_path(f))]
+        live = sum(frame_hash is not None for frame_hash in store.hashes)
+        print(f"Signature store: {live} uniques, "
+              f"{len(image_files) - len(new_files)} inputs already processed")
+        if store.dropped:
+            print(f"Signature store: dropped {store.dropped} uniques missing from {output_folder}")
+        image_files = new_files
 
-    similarity = ssim(img1_gray, img2_gray)
-    return similarity > 0.95  # Adjust threshold as needed
+    uniques = dedupe_sharded(image_files, workers, grouped, global_pass,
+                             uniques=store, log=log)
 
-# Store unique images
-unique_images = []
+    names = []
+    for filename, _ in uniques:
+        mode = link_or_copy(input_path(filename),
+                            os.path.join(output_folder, filename), MATERIALIZE_MODES)
+        print(f"Unique image ({mode}): {filename}")
+        names.append(filename)
 
-# Get all image files from input folder
-image_files = sorted([f for f in os.listdir(input_folder) if f.lower().endswith(".jpg")])
+    if store is not None:
+        for filename in image_files:
+            store.mark_seen(input_path(filename))
+        store.save()
+    return names
 
-for i, filename in enumerate(image_files):
-    image_path = os.path.join(input_folder, filename)
-    
-    is_unique = True
-    for unique_file in unique_images:
-        unique_image_path = os.path.join(output_folder, unique_file)
+def main():
+    # Ensure output directory exists
+    os.makedirs(output_folder, exist_ok=True)
 
-        if is_duplicate(image_path, unique_image_path):
-            print(f"Duplicate found: {filename} (similar to {unique_file})")
-            is_unique = False
-            break  # Stop checking once a duplicate is found
+    # Get all image files from input folder
+    image_files = sorted([f for f in FrameStore(input_folder).names() if f.lower().endswith(".jpg")])
+    store = None
+    if PERSISTENT_SIGNATURES:
+        store = SignatureStore(signature_store_dir(), SIGNATURE_SIZE,
+                               output_folder=output_folder)
+    catalog = None
+    if FRAME_CATALOG_PATH and os.path.isdir(os.path.dirname(FRAME_CATALOG_PATH)):
+        catalog = FrameCatalog(FRAME_CATALOG_PATH)
+        frame_positions.update(catalog.first_positions(input_folder))
+    log = ClusterLog()
+    dedupe(image_files, store=store, log=log)
+    write_cluster_manifest(cluster_manifest_path(), log.clusters(), merge=True)
+    if catalog is not None:
+        catalog.add_frames(catalog_rows(log, catalog))
+        catalog.close()
 
-    if is_unique:
-        unique_images.append(filename)
-        shutil.copy(image_path, os.path.join(output_folder, filename))
-        print(f"Copied unique image: {filename}")
+    print(f"\n✅ Unique images saved in: {output_folder}")
 
-print(f"\n✅ Unique images saved in: {output_folder}")
+if __name__ == "__main__":
+    main()
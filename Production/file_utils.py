@@ -0,0 +1,77 @@
+# File helpers shared by the pipeline scripts
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+
+def publish_file(src, dest):
+    """Atomically move src to dest unless dest already exists
+
+    Parallel workers can produce the same file name (the same frame hash), so
+    os.link is used as an exclusive create: the first writer wins and later
+    copies are discarded instead of being half-overwritten. Returns True when
+    src became dest. src and dest must be on the same volume.
+    """
+    try:
+        os.link(src, dest)
+    except FileExistsError:
+        os.remove(src)
+        return False
+    except OSError:
+        # Filesystem without hardlink support
+        if os.path.exists(dest):
+            os.remove(src)
+            return False
+        os.replace(src, dest)
+        return True
+    os.remove(src)
+    return True
+
+
+@contextmanager
+def atomic_write(path, encoding='utf-8', newline=None):
+    """Open a text file that replaces path only once the block completes
+
+    The data goes to a temporary file in path's folder (created if needed),
+    which is renamed over path at the end, so readers and concurrent writers
+    never see a partial file. If the block raises, the temporary file is
+    removed and path is left as it was.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding, newline=newline) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def link_or_copy(src, dest, modes=('hardlink', 'symlink', 'copy')):
+    """Materialize src at dest without copying data where the filesystem allows
+
+    The modes are tried in order: a hardlink (same volume), a symlink (may
+    need privileges on Windows) and finally a plain copy. An existing dest is
+    replaced. Returns the mode that succeeded.
+    """
+    if os.path.lexists(dest):
+        os.remove(dest)
+    for mode in modes:
+        try:
+            if mode == 'hardlink':
+                os.link(src, dest)
+            elif mode == 'symlink':
+                os.symlink(os.path.abspath(src), dest)
+            elif mode == 'copy':
+                shutil.copy(src, dest)
+            else:
+                raise ValueError(f"Unknown link mode: {mode}")
+            return mode
+        except (OSError, NotImplementedError):
+            if mode == modes[-1]:
+                raise
+    raise ValueError("No link mode given")
@@ -0,0 +1,106 @@
+# SQLite catalog of stored frames: where every sampled frame of every video lives
+import os
+import sqlite3
+from PIL import Image
+from frame_store import store_root
+
+
+def normalize_folder(folder):
+    return os.path.normcase(os.path.abspath(folder))
+
+
+def describe_image(path):
+    """Return (size in bytes, width, height); PIL only reads the file header"""
+    with Image.open(path) as img:
+        width, height = img.size
+    return os.path.getsize(path), width, height
+
+
+def open_catalog(db_path):
+    """Open an existing catalog for reading, or return None if there is none yet"""
+    if db_path and os.path.exists(db_path):
+        return FrameCatalog(db_path)
+    return None
+
+
+class FrameCatalog:
+    """Indexed record of which stored frame file shows each video at each second
+
+    One row per (folder, video_id, timestamp) with the frame's hash, path,
+    file size and dimensions. Hash-named unique frames appear once for every
+    time they were on screen. Stages look up a video's frames through the
+    (folder, video_id, timestamp) index instead of listing and parsing whole
+    folders, so per-video lookups do not grow with the total frame count.
+    """
+
+    def __init__(self, db_path):
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS frames (
+                folder TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
+                hash TEXT,
+                path TEXT NOT NULL,
+                size INTEGER,
+                width INTEGER,
+                height INTEGER,
+                PRIMARY KEY (folder, video_id, timestamp)
+            );
+            CREATE INDEX IF NOT EXISTS frames_by_path ON frames(folder, path);
+            CREATE INDEX IF NOT EXISTS frames_by_hash ON frames(hash);
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def add_frames(self, rows, replace_video=None):
+        """Insert (video_id, timestamp, hash, path, size, width, height) rows
+
+        Rows are filed under the folder of their path (the store root for
+        frames in hash-prefix shards, see frame_store). With replace_video,
+        that video's earlier rows in the same folders are removed first.
+        """
+        rows = [(normalize_folder(store_root(row[3])),) + tuple(row) for row in rows]
+        with self.connection:
+            if replace_video is not None:
+                for folder in {row[0] for row in rows}:
+                    self.connection.execute(
+                        "DELETE FROM frames WHERE folder = ? AND video_id = ?",
+                        (folder, replace_video))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO frames "
+                "(folder, video_id, timestamp, hash, path, size, width, height) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def timeline(self, folder, video_id):
+        """Return [(timestamp, path)] of a video's frames in folder, in time order"""
+        return self.connection.execute(
+            "SELECT timestamp, path FROM frames WHERE folder = ? AND video_id = ? "
+            "ORDER BY timestamp", (normalize_folder(folder), video_id)).fetchall()
+
+    def frames(self, folder):
+        """Return [(video_id, timestamp, hash, path, size, width, height)] in folder
+
+        Rows come ordered by video and time.
+        """
+        return self.connection.execute(
+            "SELECT video_id, timestamp, hash, path, size, width, height FROM frames "
+            "WHERE folder = ? ORDER BY video_id, timestamp", (normalize_folder(folder),)).fetchall()
+
+    def first_positions(self, folder):
+        """Return {file name: (video_id, timestamp)} of each file's earliest row
+
+        Earliest means first by video id, then by time.
+        """
+        positions = {}
+        for video_id, timestamp, _, path, _, _, _ in self.frames(folder):
+            positions.setdefault(os.path.basename(path), (video_id, timestamp))
+        return positions
@@ -0,0 +1,323 @@
+# Frame extraction helpers shared by the frame-stage scripts
+import os
+import json
+from bisect import bisect_right
+import cv2
+import numpy as np
+import imagehash
+from PIL import Image
+from file_utils import atomic_write
+
+# PyAV is optional: it reads packet flags without decoding, which is what the
+# keyframe index needs. Without it, seeking falls back to plain OpenCV seeks.
+try:
+    import av
+except ImportError:
+    av = None
+
+# Seeking pays off once the next target is this many seconds past a keyframe
+# that lies ahead of the current position; shorter gaps are cheaper to grab()
+MIN_SEEK_GAP_SECONDS = 2
+
+# Hashing and change detection run on ANALYSIS_WIDTH-wide grayscale
+# thumbnails; full-resolution pixels are only encoded for frames that are kept.
+# OpenCV cannot scale while decoding, so every retrieved frame is still a
+# full-resolution BGR array until it is reduced to its thumbnail.
+ANALYSIS_WIDTH = 160
+
+# Scene-change sampling: frames are sampled SCENE_SAMPLE_FPS times a second
+# and a new scene starts when more than SCENE_CHANGE_FRACTION of the
+# thumbnail pixels differ from the last emitted frame by more than
+# SCENE_PIXEL_DELTA gray levels
+SCENE_SAMPLE_FPS = 2
+SCENE_PIXEL_DELTA = 24
+SCENE_CHANGE_FRACTION = 0.02
+
+# OpenCV encoder parameter for each supported output format's quality knob;
+# PNG is lossless, so its "quality" is the zlib compression level (0-9)
+FRAME_ENCODINGS = {
+    'jpg': cv2.IMWRITE_JPEG_QUALITY,
+    'webp': cv2.IMWRITE_WEBP_QUALITY,
+    'png': cv2.IMWRITE_PNG_COMPRESSION,
+}
+# Valid range of each format's quality knob
+FRAME_QUALITY_RANGES = {
+    'jpg': (0, 100),
+    'webp': (1, 100),
+    'png': (0, 9),
+}
+
+
+def _keyframe_index_path(video_path):
+    return f"{video_path}.keyframes.json"
+
+
+def build_keyframe_index(video_path):
+    """Return the sorted keyframe times (seconds) of the first video stream
+
+    Only packets are demuxed, nothing is decoded. Times are relative to the
+    stream start, the same origin OpenCV uses for CAP_PROP_POS_MSEC.
+    """
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        start = stream.start_time or 0
+        keyframes = [
+            float((packet.pts - start) * stream.time_base)
+            for packet in container.demux(stream)
+            if packet.is_keyframe and packet.pts is not None
+        ]
+    return sorted(keyframes)
+
+
+def load_keyframe_index(video_path):
+    """Return the keyframe times for a video, building and caching them once
+
+    The index is cached next to the video as <video>.keyframes.json and rebuilt
+    when the video's size or mtime changes. Returns None when PyAV is missing
+    or the video cannot be indexed.
+    """
+    if av is None:
+        return None
+    stat = os.stat(video_path)
+    index_path = _keyframe_index_path(video_path)
+    try:
+        with open(index_path, 'r') as f:
+            cached = json.load(f)
+        if cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime:
+            return cached['keyframes']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    try:
+        keyframes = build_keyframe_index(video_path)
+    except Exception as e:
+        print(f"Could not index keyframes of {video_path}: {str(e)}")
+        return None
+    try:
+        # Segment threads may build the same index; write-then-rename keeps
+        # the cache file whole
+        with atomic_write(index_path) as f:
+            json.dump({
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'keyframes': keyframes
+            }, f)
+    except OSError as e:
+        print(f"Could not cache keyframe index {index_path}: {str(e)}")
+    return keyframes
+
+
+def preceding_keyframe(keyframes, timestamp_seconds):
+    """Return the last keyframe time at or before timestamp_seconds"""
+    position = bisect_right(keyframes, timestamp_seconds)
+    return keyframes[position - 1] if position else 0.0
+
+
+def _grab_until(cap, target_ms, position_ms):
+    """grab() forward until the current frame is at or after target_ms"""
+    while position_ms is None or position_ms + 1e-3 < target_ms:
+        if not cap.grab():
+            return None
+        position_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+    return position_ms
+
+
+def extract_frame_at(video_path, timestamp_seconds, keyframes=None):
+    """Return the frame at timestamp_seconds, or None, with bounded seek cost
+
+    The capture is positioned on the nearest preceding keyframe and decodes
+    forward only to the requested time, so at most one GOP is decoded and the
+    returned frame is the first one at or after the timestamp.
+    """
+    if keyframes is None:
+        keyframes = load_keyframe_index(video_path)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"Error opening video: {video_path}")
+        return None
+
+    try:
+        if keyframes:
+            seek_seconds = preceding_keyframe(keyframes, timestamp_seconds)
+        else:
+            seek_seconds = timestamp_seconds
+        if seek_seconds > 0:
+            cap.set(cv2.CAP_PROP_POS_MSEC, seek_seconds * 1000)
+        if _grab_until(cap, timestamp_seconds * 1000, None) is None:
+            return None
+        success, frame = cap.retrieve()
+        return frame if success else None
+    finally:
+        cap.release()
+
+
+def extract_frames_sequential(video_path, timestamps):
+    """Yield (timestamp, frame) for every requested second, opening the video once
+
+    Timestamps are visited in ascending order and the capture only ever moves
+    forward: grab() skips the frames in between and retrieve() is called only
+    for the frames that are actually returned. With a keyframe index, long
+    gaps are crossed by seeking to the keyframe before the next target rather
+    than decoding through them. Each frame is the first one whose
+    presentation time is at or after the requested second, matching what a
+    CAP_PROP_POS_MSEC seek returns.
+    """
+    targets = sorted(set(timestamps))
+    if not targets:
+        return
+
+    keyframes = load_keyframe_index(video_path)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"Error opening video: {video_path}")
+        return
+
+    try:
+        position_ms = None  # presentation time of the last grabbed frame
+        for timestamp in targets:
+            # Jump over long gaps by seeking to the keyframe before the target
+            # (or, without an index, straight to the first target once)
+            if keyframes:
+                keyframe = preceding_keyframe(keyframes, timestamp)
+                current = 0 if position_ms is None else position_ms / 1000
+                if keyframe > 0 and keyframe - current >= MIN_SEEK_GAP_SECONDS:
+                    cap.set(cv2.CAP_PROP_POS_MSEC, keyframe * 1000)
+                    position_ms = None
+            elif position_ms is None and timestamp > 0:
+                cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
+
+            position_ms = _grab_until(cap, timestamp * 1000, position_ms)
+            if position_ms is None:
+                print(f"Failed to extract frame at {timestamp}s from {video_path}")
+                return
+
+            success, frame = cap.retrieve()
+            if success:
+                yield timestamp, frame
+            else:
+                print(f"Failed to extract frame at {timestamp}s from {video_path}")
+    finally:
+        cap.release()
+
+
+def hash_frame(frame, hash_size=16):
+    """Return the average_hash of a decoded BGR frame without a JPEG round trip
+
+    The hash is computed from the small grayscale analysis image, so the
+    full-resolution frame is area-averaged once and never color-converted or
+    copied. Hashes can differ in a few bits from hashing the re-read JPEG
+    (1-3 of 256 bits for about a quarter of 1080p slides), so frames hashed
+    the legacy way may not match exactly.
+    """
+    small = analysis_image(frame)
+    return str(imagehash.average_hash(Image.fromarray(small), hash_size=hash_size))
+
+
+def video_duration(video_path):
+    """Return the video duration in seconds, or None if the container won't say"""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    finally:
+        cap.release()
+    if fps > 0 and frame_count > 0:
+        return frame_count / fps
+    return None
+
+
+def analysis_image(frame, width=ANALYSIS_WIDTH):
+    """Return a small grayscale copy of a BGR frame for cheap comparisons
+
+    Downscaling happens before the color conversion, so only the thumbnail is
+    converted; the full-resolution frame is left untouched for the keepers.
+    """
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+
+def scene_changed(reference, candidate):
+    """True when enough pixels differ between two analysis images"""
+    changed = np.count_nonzero(cv2.absdiff(reference, candidate) > SCENE_PIXEL_DELTA)
+    return changed > SCENE_CHANGE_FRACTION * reference.size
+
+
+def detect_scene_changes(video_path, start_seconds=0, end_seconds=None,
+                         sample_fps=SCENE_SAMPLE_FPS):
+    """Yield (timestamp, frame) for the first frame of every slide/chart change
+
+    The stream is sampled sample_fps times a second between start_seconds and
+    end_seconds; frames in between are only grab()bed. Each sample is reduced
+    to a small grayscale image and compared with the last emitted one, so
+    gradual changes still add up to a new scene. The first sample is always
+    emitted. Timestamps are float seconds. Samples are retrieved into one
+    reused full-resolution buffer and only emitted frames are copied out of it.
+    """
+    keyframes = load_keyframe_index(video_path)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"Error opening video: {video_path}")
+        return
+
+    try:
+        if start_seconds > 0:
+            if keyframes:
+                seek_seconds = preceding_keyframe(keyframes, start_seconds)
+            else:
+                seek_seconds = start_seconds
+            if seek_seconds > 0:
+                cap.set(cv2.CAP_PROP_POS_MSEC, seek_seconds * 1000)
+
+        interval_ms = 1000 / sample_fps
+        end_ms = None if end_seconds is None else end_seconds * 1000
+        next_ms = start_seconds * 1000
+        position_ms = None
+        reference = None
+        frame = None
+        while True:
+            position_ms = _grab_until(cap, next_ms, position_ms)
+            if position_ms is None or (end_ms is not None and position_ms >= end_ms):
+                return
+
+            success, frame = cap.retrieve(frame)
+            if not success:
+                return
+            small = analysis_image(frame)
+            if reference is None or scene_changed(reference, small):
+                reference = small
+                yield position_ms / 1000, frame.copy()
+            next_ms = max(next_ms + interval_ms, position_ms + 1)
+    finally:
+        cap.release()
+
+
+def encode_frame(frame, image_format='jpg', quality=None, max_width=None):
+    """Return a frame encoded as image_format bytes, downscaled to max_width if wider
+
+    quality is checked against FRAME_QUALITY_RANGES, as OpenCV silently
+    clamps or misreads out-of-range values (e.g. a JPEG quality passed as a
+    PNG compression level). None keeps OpenCV's default for the format.
+    """
+    if image_format not in FRAME_ENCODINGS:
+        raise ValueError(f"Unsupported frame format: {image_format}")
+    if quality is not None:
+        low, high = FRAME_QUALITY_RANGES[image_format]
+        if not low <= quality <= high:
+            raise ValueError(f"{image_format} quality must be within {low}-{high}, got {quality}")
+    if max_width and frame.shape[1] > max_width:
+        height = max(1, round(frame.shape[0] * max_width / frame.shape[1]))
+        frame = cv2.resize(frame, (max_width, height), interpolation=cv2.INTER_AREA)
+    params = [] if quality is None else [FRAME_ENCODINGS[image_format], int(quality)]
+    success, buffer = cv2.imencode(f".{image_format}", frame, params)
+    if not success:
+        raise IOError(f"Could not encode frame as {image_format}")
+    return buffer.tobytes()
+
+
+def write_frame(path, frame, image_format='jpg', quality=None, max_width=None):
+    """Encode a frame and write it to path; safe to run on encoder threads"""
+    data = encode_frame(frame, image_format, quality, max_width)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
@@ -0,0 +1,101 @@
+# Interval index mapping transcript times to the frame that was on screen
+import os
+import re
+from bisect import bisect_right
+from cluster_manifest import read_cluster_manifest
+from frame_store import FrameStore
+
+# <video_id>_<seconds>, as a frame file name or a frame-stage cluster member
+TIMESTAMP_NAME = re.compile(r'^(.+)_(\d+)(\.[A-Za-z]+)?$')
+FRAME_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+class FrameIntervalIndex:
+    """Frames sorted by start time, each covering the span until the next starts
+
+    Built from (timestamp, frame) pairs, where frame can be anything (a path,
+    a hash). lookup() bisects the start times, so assigning n transcript
+    entries to m frames costs O(n log m) and entries may come in any order.
+    Times before the first frame belong to the first frame.
+    """
+
+    def __init__(self, frames):
+        frames = sorted(frames, key=lambda item: item[0])
+        self.starts = [timestamp for timestamp, _ in frames]
+        self.frames = [frame for _, frame in frames]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def position(self, timestamp):
+        """Index of the frame covering timestamp, or None if there are no frames"""
+        if not self.starts:
+            return None
+        return max(0, bisect_right(self.starts, timestamp) - 1)
+
+    def lookup(self, timestamp):
+        """The frame covering timestamp, or None if there are no frames"""
+        position = self.position(timestamp)
+        return None if position is None else self.frames[position]
+
+
+def load_frame_timeline(folder, video_id, cluster_manifests=(), catalog=None,
+                        list_folder=True):
+    """Return sorted [(seconds, path)] for each time a frame in folder was on screen
+
+    When a FrameCatalog has rows for this folder and video they are returned
+    from its index. Otherwise the folder is listed: timestamp-named files
+    (<video_id>_<seconds>.jpg) carry their own time, and hash-named files get
+    theirs from cluster manifests. The frame stage's per-video manifest lists
+    every <video_id>_<seconds> sample folded into each unique frame, and a
+    dedupe manifest points frames that were dropped at the survivor kept in
+    folder. Missing manifests are skipped. Frames may be stored flat or in
+    FrameStore's hash-prefix shards.
+
+    Without list_folder the folder is never listed: only frames named by the
+    manifests are placed, each checked with FrameStore.resolve, so the cost
+    follows the video's manifest instead of the folder size.
+    """
+    if catalog is not None:
+        timeline = catalog.timeline(folder, video_id)
+        if timeline:
+            return timeline
+
+    store = FrameStore(folder)
+    names = {}  # file name -> path, or None when it is not stored
+    occurrences = set()
+    survivors = {}  # dropped frame name -> the name it was folded into
+
+    if list_folder:
+        for name, path in store.paths():
+            if os.path.splitext(name)[1].lower() in FRAME_EXTENSIONS:
+                names.setdefault(name, path)
+        for name in names:
+            match = TIMESTAMP_NAME.match(name)
+            if match and match.group(1) == video_id:
+                occurrences.add((int(match.group(2)), name))
+
+    def stored(name):
+        if name not in names and not list_folder:
+            names[name] = store.resolve(name)
+        return names.get(name)
+
+    for manifest_path in cluster_manifests:
+        for representative, members in read_cluster_manifest(manifest_path).items():
+            representative = os.path.basename(representative)
+            for member, _ in members:
+                match = TIMESTAMP_NAME.match(member)
+                if match and match.group(1) == video_id:
+                    occurrences.add((int(match.group(2)), representative))
+                elif member != representative:
+                    survivors[member] = representative
+
+    timeline = []
+    for seconds, name in occurrences:
+        seen = set()
+        while stored(name) is None and name in survivors and name not in seen:
+            seen.add(name)
+            name = survivors[name]
+        if stored(name) is not None:
+            timeline.append((seconds, stored(name)))
+    return sorted(set(timeline))
@@ -0,0 +1,139 @@
+# Bounded-queue streaming pipeline for the frame stage:
+# decode -> hash -> (dedupe in the caller) -> encode/write
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+
+class FramePipeline:
+    """Run decoding, hashing and encoding/writing of frames as concurrent stages
+
+    A decoder thread drains the (timestamp, frame) generator, hash_workers
+    threads call hash_fn(timestamp, frame), and run() yields
+    (timestamp, frame_hash, frame) back to the caller in the original order.
+    Work handed to write() runs on a pool of write_workers threads. Every
+    hand-off is bounded by queue_size, so a slow stage stalls the ones before
+    it (backpressure) instead of piling frames up in memory. OpenCV decode,
+    resize and encode release the GIL, so the stages overlap on real cores.
+
+    Use as a context manager: leaving the block waits for pending writes.
+    """
+
+    def __init__(self, hash_fn, hash_workers=2, write_workers=2, queue_size=4):
+        self.hash_fn = hash_fn
+        self.hash_workers = max(1, hash_workers)
+        self.queue_size = max(1, queue_size)
+        self._writer = ThreadPoolExecutor(max_workers=max(1, write_workers))
+        self._write_slots = threading.BoundedSemaphore(self.queue_size)
+        self._stop = threading.Event()
+        self._decode_error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Stop the decode/hash stages and wait for pending writes"""
+        self._stop.set()
+        self._writer.shutdown(wait=True)
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _decode(self, frames, decoded):
+        try:
+            for seq, (timestamp, frame) in enumerate(frames):
+                if not self._put(decoded, (seq, timestamp, frame)):
+                    return
+        except Exception as e:
+            self._decode_error = e
+        finally:
+            for _ in range(self.hash_workers):
+                self._put(decoded, _DONE)
+
+    def _hash(self, decoded, hashed):
+        while True:
+            item = self._get(decoded)
+            if item is _DONE:
+                break
+            seq, timestamp, frame = item
+            try:
+                frame_hash = self.hash_fn(timestamp, frame)
+            except Exception as e:
+                print(f"Error processing {timestamp}: {str(e)}")
+                frame_hash = None
+            if not self._put(hashed, (seq, timestamp, frame_hash, frame)):
+                return
+        self._put(hashed, _DONE)
+
+    def run(self, frames):
+        """Yield (timestamp, frame_hash, frame) for frames, in input order
+
+        Frames whose hash_fn raised are reported and skipped. An exception
+        raised by the frames generator itself is re-raised here.
+        """
+        decoded = queue.Queue(self.queue_size)
+        hashed = queue.Queue(self.queue_size)
+        threads = [threading.Thread(target=self._decode, args=(frames, decoded), daemon=True)]
+        threads += [
+            threading.Thread(target=self._hash, args=(decoded, hashed), daemon=True)
+            for _ in range(self.hash_workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        # Hash workers finish out of order; hold results until their turn
+        pending = {}
+        next_seq = 0
+        finished = 0
+        try:
+            while finished < self.hash_workers:
+                item = self._get(hashed)
+                if item is _DONE:
+                    finished += 1
+                    continue
+                pending[item[0]] = item
+                while next_seq in pending:
+                    _, timestamp, frame_hash, frame = pending.pop(next_seq)
+                    next_seq += 1
+                    if frame_hash is not None:
+                        yield timestamp, frame_hash, frame
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        if self._decode_error is not None:
+            raise self._decode_error
+
+    def write(self, fn, *args):
+        """Run fn(*args) on the writer pool, blocking while queue_size writes are pending"""
+        self._write_slots.acquire()
+        try:
+            future = self._writer.submit(fn, *args)
+        except BaseException:
+            self._write_slots.release()
+            raise
+        future.add_done_callback(self._write_done)
+
+    def _write_done(self, future):
+        self._write_slots.release()
+        if future.exception() is not None:
+            print(f"Error writing frame: {str(future.exception())}")
@@ -0,0 +1,149 @@
+# Content-addressed frame storage: <root>/<ab>/<cd>/<hash>.jpg instead of one
+# flat folder holding every frame of the corpus.
+#
+#   python frame_store.py D:\AI_train_data\Train_Prod\unique_frames --migrate
+#
+# moves the frames of an existing flat folder into the sharded layout.
+import os
+import sys
+import argparse
+from file_utils import publish_file
+
+# Two directory levels of two hash characters each: 65536 leaf folders, so a
+# million frames leave about 15 files per folder
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+
+def store_root(path):
+    """Folder a stored frame belongs to, whether it sits flat or in its shard"""
+    folder, name = os.path.split(path)
+    stem = os.path.splitext(name)[0].lower()
+    for level in reversed(range(SHARD_LEVELS)):
+        folder, part = os.path.split(folder)
+        if part.lower() != stem[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH]:
+            return os.path.dirname(path)
+    return folder
+
+
+class FrameStore:
+    """Frames stored by name under root, flat or in hash-prefix shard folders
+
+    Frames are addressed by their hash (or any file name): "<hash>", "<hash>.jpg"
+    and full paths all name the same frame. resolve() finds a frame with at
+    most two stat calls, looking in its shard folder first and then in the
+    flat root, so folders part-way through a migration and scripts that still
+    write flat files keep working. New frames go to the shard folder when
+    sharded is set and to root otherwise.
+    """
+
+    def __init__(self, root, extension='.jpg', sharded=True):
+        self.root = root
+        self.extension = extension
+        self.sharded = sharded
+
+    def file_name(self, name):
+        """File name of a frame given as a hash, a file name or a path"""
+        name = os.path.basename(name)
+        if not os.path.splitext(name)[1]:
+            name += self.extension
+        return name
+
+    def shard_dir(self, name):
+        """Shard folder of a frame, or root for names too short to shard"""
+        stem = os.path.splitext(self.file_name(name))[0].lower()
+        if len(stem) < SHARD_LEVELS * SHARD_WIDTH:
+            return self.root
+        parts = [stem[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)]
+        return os.path.join(self.root, *parts)
+
+    def path(self, name):
+        """Where a new frame of this name is stored"""
+        folder = self.shard_dir(name) if self.sharded else self.root
+        return os.path.join(folder, self.file_name(name))
+
+    def resolve(self, name):
+        """Path of a stored frame, sharded or flat, or None if it is not stored"""
+        file_name = self.file_name(name)
+        for folder in (self.shard_dir(file_name), self.root):
+            path = os.path.join(folder, file_name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def __contains__(self, name):
+        return self.resolve(name) is not None
+
+    def publish(self, src, name):
+        """Move the file src into the store as name; return the stored path
+
+        As with publish_file, the first writer of a name wins and later
+        copies are discarded. src must be on the same volume as the store.
+        """
+        dest = self.path(name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        publish_file(src, dest)
+        return dest
+
+    def paths(self):
+        """Yield (file name, path) of every stored frame, flat ones first"""
+        if not os.path.isdir(self.root):
+            return
+        shard_dirs = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    yield entry.name, entry.path
+                elif entry.is_dir() and len(entry.name) == SHARD_WIDTH:
+                    shard_dirs.append(entry.path)
+        for _ in range(1, SHARD_LEVELS):
+            shard_dirs = [entry.path for folder in shard_dirs for entry in os.scandir(folder)
+                          if entry.is_dir() and len(entry.name) == SHARD_WIDTH]
+        for folder in shard_dirs:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        yield entry.name, entry.path
+
+    def names(self):
+        """Yield the file name of every stored frame"""
+        for name, _ in self.paths():
+            yield name
+
+    def migrate(self):
+        """Move the flat files with this store's extension into their shard folders
+
+        Returns the number of files moved. Each move is a rename within the
+        volume, and a frame already present in its shard keeps that copy.
+        """
+        moved = 0
+        for name, path in list(self.paths()):
+            if path != os.path.join(self.root, name) or not name.lower().endswith(self.extension):
+                continue
+            shard_dir = self.shard_dir(name)
+            if shard_dir == self.root:
+                continue
+            os.makedirs(shard_dir, exist_ok=True)
+            publish_file(path, os.path.join(shard_dir, name))
+            moved += 1
+        return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or migrate a frame folder')
+    parser.add_argument('root')
+    parser.add_argument('--extension', default='.jpg')
+    parser.add_argument('--migrate', action='store_true',
+                        help='move flat frames into the sharded layout')
+    args = parser.parse_args()
+
+    store = FrameStore(args.root, args.extension)
+    if args.migrate:
+        print(f"Moved {store.migrate()} frames into shard folders")
+    flat = sum(1 for name, path in store.paths() if path == os.path.join(args.root, name))
+    total = sum(1 for _ in store.paths())
+    print(f"{total} frames in {args.root}: {total - flat} sharded, {flat} flat")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+# Persistent perceptual-hash index shared across runs and videos
+import os
+import re
+import sqlite3
+from frame_store import FrameStore
+
+HEX_HASH_PATTERN = re.compile(r'^[0-9a-f]{16,}$')
+
+
+def hamming_distance(hash_a, hash_b):
+    """Number of differing bits between two hex hash strings"""
+    return (int(hash_a, 16) ^ int(hash_b, 16)).bit_count()
+
+
+class HashIndex:
+    """SQLite-backed index of frame hashes with Hamming-radius lookup
+
+    Lookups use multi-index hashing. Each hash is split into `chunks` equal
+    slices and every slice is stored in an indexed table. Two hashes within
+    radius r bits differ in at most r slices, so they agree exactly on at
+    least one of any r + 1 slices (pigeonhole). A query therefore probes only
+    the r + 1 slice values of the query hash that the fewest stored hashes
+    share (per-value counts are kept in chunk_counts) and verifies those
+    candidates. This matters on real frames: dark chart frames share slices
+    such as 0x0000 with most of the corpus, and probing every slice would
+    make nearly every stored hash a candidate. Exact lookups (radius 0) use
+    the hash column's unique index directly. With the default 16 chunks a
+    256-bit average_hash supports radii up to 15.
+    """
+
+    def __init__(self, db_path, chunks=16):
+        self.chunks = chunks
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                id INTEGER PRIMARY KEY,
+                hash TEXT UNIQUE NOT NULL,
+                path TEXT NOT NULL,
+                video TEXT,
+                timestamp INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS hash_chunks (
+                position INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                hash_id INTEGER NOT NULL REFERENCES hashes(id)
+            );
+            CREATE INDEX IF NOT EXISTS hash_chunks_lookup
+                ON hash_chunks(position, value);
+            CREATE TABLE IF NOT EXISTS chunk_counts (
+                position INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (position, value)
+            );
+        """)
+        # Indexes written before chunk_counts existed
+        if (self.connection.execute("SELECT 1 FROM chunk_counts LIMIT 1").fetchone() is None
+                and self.connection.execute("SELECT 1 FROM hash_chunks LIMIT 1").fetchone()):
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO chunk_counts (position, value, count) "
+                    "SELECT position, value, COUNT(*) FROM hash_chunks GROUP BY position, value")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _split(self, frame_hash):
+        width = len(frame_hash) // self.chunks
+        if width == 0 or len(frame_hash) % self.chunks:
+            raise ValueError(f"Hash length {len(frame_hash)} is not divisible into {self.chunks} chunks")
+        return [int(frame_hash[i * width:(i + 1) * width], 16) for i in range(self.chunks)]
+
+    def is_empty(self):
+        return self.connection.execute("SELECT 1 FROM hashes LIMIT 1").fetchone() is None
+
+    def add(self, frame_hash, path, video=None, timestamp=None):
+        """Insert a hash, or point an existing one at a new path"""
+        with self.connection:
+            self._add(frame_hash, path, video, timestamp)
+
+    def _add(self, frame_hash, path, video, timestamp):
+        chunk_values = self._split(frame_hash)
+        # Insert first, so another process adding the same hash between a
+        # lookup and the insert cannot make it fail; only a new row gets chunks
+        cursor = self.connection.execute(
+            "INSERT INTO hashes (hash, path, video, timestamp) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(hash) DO NOTHING",
+            (frame_hash, path, video, timestamp)
+        )
+        if cursor.rowcount == 0:
+            self.connection.execute(
+                "UPDATE hashes SET path = ?, video = ?, timestamp = ? WHERE hash = ?",
+                (path, video, timestamp, frame_hash)
+            )
+            return
+        hash_id = cursor.lastrowid
+        self.connection.executemany(
+            "INSERT INTO hash_chunks (position, value, hash_id) VALUES (?, ?, ?)",
+            [(position, value, hash_id) for position, value in enumerate(chunk_values)]
+        )
+        self.connection.executemany(
+            "INSERT INTO chunk_counts (position, value, count) VALUES (?, ?, 1) "
+            "ON CONFLICT(position, value) DO UPDATE SET count = count + 1",
+            list(enumerate(chunk_values))
+        )
+
+    def query(self, frame_hash, radius):
+        """Return [(distance, hash, path)] within radius bits, nearest first"""
+        if radius >= self.chunks:
+            raise ValueError(f"radius must be below the chunk count ({self.chunks})")
+        if radius == 0:
+            row = self.connection.execute(
+                "SELECT path FROM hashes WHERE hash = ?", (frame_hash,)).fetchone()
+            return [(0, frame_hash, row[0])] if row else []
+
+        # Probe the radius + 1 rarest slices of the query hash
+        slices = []
+        for position, value in enumerate(self._split(frame_hash)):
+            row = self.connection.execute(
+                "SELECT count FROM chunk_counts WHERE position = ? AND value = ?",
+                (position, value)).fetchone()
+            slices.append((row[0] if row else 0, position, value))
+        slices.sort()
+
+        candidates = {}
+        for _, position, value in slices[:radius + 1]:
+            for stored_hash, path in self.connection.execute(
+                    "SELECT h.hash, h.path FROM hash_chunks c JOIN hashes h ON h.id = c.hash_id "
+                    "WHERE c.position = ? AND c.value = ?", (position, value)):
+                candidates[stored_hash] = path
+
+        matches = []
+        for stored_hash, path in candidates.items():
+            distance = hamming_distance(frame_hash, stored_hash)
+            if distance <= radius:
+                matches.append((distance, stored_hash, path))
+        return sorted(matches)
+
+    def find(self, frame_hash, radius=0):
+        """Return (hash, path) of the nearest stored hash whose file still exists"""
+        for _, stored_hash, path in self.query(frame_hash, radius):
+            if os.path.exists(path):
+                return stored_hash, path
+        return None
+
+    def import_folder(self, folder, extension='.jpg'):
+        """Register existing <hash><extension> files, e.g. a unique_frames folder
+
+        Both the flat layout and FrameStore's hash-prefix shards are read.
+        """
+        count = 0
+        with self.connection:
+            for file_name, path in FrameStore(folder, extension).paths():
+                stem, ext = os.path.splitext(file_name)
+                if ext.lower() != extension or not HEX_HASH_PATTERN.match(stem):
+                    continue
+                try:
+                    self._add(stem, path, None, None)
+                except ValueError:
+                    continue  # a hash size this index was not built for
+                count += 1
+        return count
+
+
+class BKTree:
+    """In-memory BK-tree over integer hashes for Hamming-radius queries
+
+    Each node keeps the values stored under its key and its children by
+    distance; the triangle inequality lets a search skip every subtree whose
+    edge distance is more than radius away from the query's distance.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, key, value):
+        self.size += 1
+        if self.root is None:
+            self.root = (key, [value], {})
+            return
+        node = self.root
+        while True:
+            distance = (key ^ node[0]).bit_count()
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (key, [value], {})
+                return
+            node = child
+
+    def search(self, key, radius):
+        """Return [(distance, value)] for every stored key within radius bits"""
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_key, values, children = stack.pop()
+            distance = (key ^ node_key).bit_count()
+            if distance <= radius:
+                results.extend((distance, value) for value in values)
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return results
@@ -2,10 +2,23 @@ import os
 import tkinter as tk
 from tkinter import Label, Button
 from PIL import Image, ImageTk
+from frame_catalog import open_catalog
+from frame_store import FrameStore
 
 # Folder containing images
 image_folder = r"D:\AI_train_data\Train_Prod\unique_frames"
-image_files = sorted([f for f in os.listdir(image_folder) if f.lower().endswith(".jpg")])
+# Frame catalog: when it lists the folder, images are shown in video and time order
+frame_catalog = r"D:\AI_train_data\Train_Prod\frame_catalog.sqlite"
+
+frame_store = FrameStore(image_folder)
+image_files = sorted([f for f in frame_store.names() if f.lower().endswith(".jpg")])
+positions = {}
+catalog = open_catalog(frame_catalog)
+if catalog is not None:
+    positions = catalog.first_positions(image_folder)
+    catalog.close()
+# Cataloged images first, by (video, seconds); the rest after them by name
+image_files.sort(key=lambda f: (0,) + positions[f] if f in positions else (1, '', 0))
 
 # Track current image index
 current_index = 0
@@ -14,13 +27,17 @@ def update_image():
     """ Update the displayed image """
     global current_index, img_label, img_display
 
-    img_path = os.path.join(image_folder, image_files[current_index])
+    img_path = frame_store.resolve(image_files[current_index])
     img = Image.open(img_path)
     img = img.resize((800, 600))  # Resize for display
     img_display = ImageTk.PhotoImage(img)
 
     img_label.config(image=img_display)
-    root.title(f"Image Viewer - {image_files[current_index]}")
+    title = f"Image Viewer - {image_files[current_index]}"
+    if image_files[current_index] in positions:
+        video_id, seconds = positions[image_files[current_index]]
+        title += f" ({video_id} at {seconds // 60}:{seconds % 60:02d})"
+    root.title(title)
 
 def next_image():
     """ Show the next image """
@@ -8,6 +8,9 @@ import textwrap
 import nltk
 from nltk.tokenize import sent_tokenize
 from transformers import pipeline
+from transcript_parser import iter_transcript
+from frame_index import FrameIntervalIndex, load_frame_timeline
+from frame_catalog import open_catalog
 
 # Download necessary NLTK data
 nltk.download('punkt')
@@ -17,51 +20,35 @@ def extract_timestamp_seconds(filename):
     match = re.search(r'_(\d+)\.jpg$', filename)
     return int(match.group(1)) if match else None
 
-def get_image_timestamps(image_folder, video_id):
-    # Get all image timestamps for a video in sorted order
-    timestamps = []
+def get_image_timestamps(image_folder, video_id, catalog=None):
+    # Get all image timestamps for a video in sorted order, from the frame
+    # catalog when it has the video; otherwise hash-named frames are placed
+    # through the cluster manifests (manifestT next to image_folder)
+    folder = image_folder.rstrip(os.sep + '/')
+    manifest_dir = os.path.join(os.path.dirname(folder), 'manifestT')
+    manifests = [os.path.join(manifest_dir, f"{video_id}.clusters.{fmt}") for fmt in ('json', 'csv')]
+    manifests += [f"{folder}.clusters.{fmt}" for fmt in ('json', 'csv')]
     images = {}
-    for img in os.listdir(image_folder):
-        if img.startswith(video_id) and img.endswith('.jpg'):
-            timestamp = extract_timestamp_seconds(img)
-            if timestamp is not None:
-                timestamps.append(timestamp)
-                images[timestamp] = img
-    return sorted(timestamps), images
+    for timestamp, path in load_frame_timeline(image_folder, video_id, manifests, catalog):
+        images.setdefault(timestamp, path)
+    return sorted(images), images
 
 def process_transcript(transcript_file, image_timestamps):
-    grouped_content = {}
-    current_image_idx = 0
-    current_group_texts = []
+    # Each entry goes to the image whose time span covers it
+    grouped_texts = {}
+    index = FrameIntervalIndex((timestamp, timestamp) for timestamp in image_timestamps)
     
     try:
-        with open(transcript_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-            matches = re.finditer(r'\[(\d{2}):(\d{2})\](.*?)(?=\[\d{2}:\d{2}\]|$)', content, re.DOTALL)
-            
-            for match in matches:
-                minutes = int(match.group(1))
-                seconds = int(match.group(2))
-                text = match.group(3).strip()
-                current_timestamp = minutes * 60 + seconds
-
-                while (current_image_idx < len(image_timestamps) - 1 and 
-                       current_timestamp >= image_timestamps[current_image_idx + 1]):
-                    if current_group_texts:
-                        grouped_content[image_timestamps[current_image_idx]] = ' '.join(current_group_texts)
-                        current_group_texts = []
-                    current_image_idx += 1
-
-                current_group_texts.append(text)
-
-            if current_group_texts:
-                grouped_content[image_timestamps[current_image_idx]] = ' '.join(current_group_texts)
+        for timestamp, text in iter_transcript(transcript_file):
+            image_timestamp = index.lookup(timestamp)
+            if image_timestamp is not None:
+                grouped_texts.setdefault(image_timestamp, []).append(text)
 
     except Exception as e:
         print(f"Error processing transcript file: {str(e)}")
         return {}
     
-    return grouped_content
+    return {timestamp: ' '.join(texts) for timestamp, texts in grouped_texts.items()}
 
 def format_text(text):
     # Remove timestamps
@@ -92,7 +79,8 @@ def generate_summary(text):
     
     return ' '.join(summaries)
 
-def create_pdf(image_folder, transcript_folder, output_pdf):
+def create_pdf(image_folder, transcript_folder, output_pdf, catalog_path=None):
+    catalog = open_catalog(catalog_path)
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=15)
     
@@ -108,7 +96,7 @@ def create_pdf(image_folder, transcript_folder, output_pdf):
         transcript_path = os.path.join(transcript_folder, transcript_file)
         
         # Get image timestamps and files
-        image_timestamps, image_files = get_image_timestamps(image_folder, video_id)
+        image_timestamps, image_files = get_image_timestamps(image_folder, video_id, catalog)
         grouped_content = process_transcript(transcript_path, image_timestamps)
         
         # Format all text and store in chronological order
@@ -122,6 +110,8 @@ def create_pdf(image_folder, transcript_folder, output_pdf):
                 'image': image_files.get(timestamp)
             })
             full_text += formatted_text + " "
+    if catalog is not None:
+        catalog.close()
     
     # Sort content by timestamp
     all_content.sort(key=lambda x: (x['key'].split('_')[0], x['timestamp']))
@@ -147,7 +137,7 @@ def create_pdf(image_folder, transcript_folder, output_pdf):
         
         # Add image if it exists
         if content['image']:
-            img_path = os.path.join(image_folder, content['image'])
+            img_path = content['image']
             if os.path.exists(img_path):
                 pdf.image(img_path, x=10, y=pdf.get_y(), w=190)
                 pdf.ln(140)  # Space after image
@@ -166,5 +156,6 @@ if __name__ == "__main__":
     image_folder = "D:\\AI_train_data\\Train_Prod\\unique_framesT"
     transcript_folder = "D:\\AI_train_data\\Train_Prod\\transcriptsT"
     output_pdf = "D:\\AI_train_data\\Train_Prod\\pdf_outputT\\output.pdf"
+    frame_catalog = "D:\\AI_train_data\\Train_Prod\\frame_catalog.sqlite"
     
-    create_pdf(image_folder, transcript_folder, output_pdf)
+    create_pdf(image_folder, transcript_folder, output_pdf, frame_catalog)
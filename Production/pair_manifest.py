@@ -0,0 +1,52 @@
+# Per-pair processing manifest so re-runs skip unchanged video/transcript pairs
+import os
+import json
+import hashlib
+from file_utils import atomic_write
+
+
+def _file_fingerprint(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+class PairManifest:
+    """Completed stages of one transcript/video pair, stored as a small JSON file
+
+    The record is keyed by both file paths, their sizes and mtimes, and the
+    code/config version. If any of those change the stored stages are
+    ignored and the pair is processed from scratch. Every pair has its own
+    file, so parallel workers never write the same record.
+    """
+
+    def __init__(self, manifest_dir, transcript_path, video_path, version):
+        self.fingerprint = {
+            'transcript': _file_fingerprint(transcript_path),
+            'video': _file_fingerprint(video_path),
+            'version': version
+        }
+        key = f"{os.path.abspath(transcript_path)}|{os.path.abspath(video_path)}"
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+        base_name = os.path.splitext(os.path.basename(transcript_path))[0]
+        self.path = os.path.join(manifest_dir, f"{base_name}-{digest}.json")
+        self.stages = {}
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            if record.get('fingerprint') == self.fingerprint:
+                self.stages = record.get('stages', {})
+        except (OSError, ValueError):
+            pass
+
+    def is_done(self, stage):
+        return stage in self.stages
+
+    def get(self, stage):
+        return self.stages.get(stage)
+
+    def mark_done(self, stage, data=None):
+        """Record a completed stage (with optional result data) and save atomically"""
+        self.stages[stage] = data
+        with atomic_write(self.path) as f:
+            json.dump({'fingerprint': self.fingerprint, 'stages': self.stages}, f)
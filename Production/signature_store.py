@@ -0,0 +1,116 @@
+# Persistent, memory-mapped store of dedupe signatures shared across runs
+import os
+import json
+import numpy as np
+from file_utils import atomic_write
+
+MATRIX_FILE = 'signatures.npy'
+TABLE_FILE = 'signatures.json'
+
+
+class SignatureStore:
+    """Signatures of accepted unique images, kept on disk between dedupe runs
+
+    The signatures live in a memory-mapped .npy matrix (one row per unique)
+    and a JSON table holds, per row, the file name and thumbnail hash, plus
+    the size and mtime of every input file already processed. Opening the
+    store maps the matrix without reading it, so a new run starts at once and
+    only decodes input files it has not seen.
+
+    Rows are written straight into the mapping; the JSON table is the commit
+    point, so rows appended by a run that never called save() are ignored.
+    The matrix doubles in size (copy, then atomic rename) when it is full.
+    It supports the same len/indexing/add interface as SignatureSet.
+
+    With output_folder, uniques whose file is no longer there (deleted in
+    review, or the whole folder removed) are dropped on open: their rows keep
+    their place but lose their hash, so they are never compared again, and
+    their inputs are no longer seen, so they are processed again. When no
+    unique is left the store starts over empty.
+    """
+
+    def __init__(self, directory, signature_size, capacity=1024, output_folder=None):
+        self.directory = directory
+        self.matrix_path = os.path.join(directory, MATRIX_FILE)
+        self.table_path = os.path.join(directory, TABLE_FILE)
+        self.shape = (signature_size, signature_size)
+        self.names = []
+        self.hashes = []
+        self.seen = {}
+        self.dropped = 0
+        os.makedirs(directory, exist_ok=True)
+
+        try:
+            with open(self.table_path, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+            if tuple(table['shape']) == self.shape and os.path.exists(self.matrix_path):
+                self.names = table['names']
+                self.hashes = table['hashes']
+                self.seen = table['seen']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if output_folder is not None:
+            self._drop_missing(output_folder)
+        if self.names:
+            self.array = np.load(self.matrix_path, mmap_mode='r+')
+        else:
+            self.array = self._create(self.matrix_path, capacity)
+
+    def _drop_missing(self, output_folder):
+        for row, name in enumerate(self.names):
+            if self.hashes[row] is None or os.path.exists(os.path.join(output_folder, name)):
+                continue
+            self.hashes[row] = None
+            self.seen.pop(name, None)
+            self.dropped += 1
+        if all(frame_hash is None for frame_hash in self.hashes):
+            self.names, self.hashes, self.seen = [], [], {}
+
+    def _create(self, path, capacity):
+        return np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8,
+                                         shape=(capacity,) + self.shape)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def _grow(self):
+        count = len(self.names)
+        tmp_path = self.matrix_path + '.tmp'
+        grown = self._create(tmp_path, 2 * len(self.array))
+        grown[:count] = self.array[:count]
+        grown.flush()
+        # Windows cannot replace a file that is still mapped
+        del grown
+        self.array = None
+        os.replace(tmp_path, self.matrix_path)
+        self.array = np.load(self.matrix_path, mmap_mode='r+')
+
+    def add(self, name, signature, frame_hash=None):
+        """Append a signature (and its thumbnail hash) and return its row index"""
+        index = len(self.names)
+        if index == len(self.array):
+            self._grow()
+        self.array[index] = signature
+        self.names.append(name)
+        self.hashes.append(frame_hash)
+        return index
+
+    def is_seen(self, path):
+        """Whether this input file was processed by an earlier run, unchanged"""
+        stat = os.stat(path)
+        return self.seen.get(os.path.basename(path)) == [stat.st_size, stat.st_mtime_ns]
+
+    def mark_seen(self, path):
+        stat = os.stat(path)
+        self.seen[os.path.basename(path)] = [stat.st_size, stat.st_mtime_ns]
+
+    def save(self):
+        """Flush the matrix, then atomically commit the table"""
+        self.array.flush()
+        with atomic_write(self.table_path) as f:
+            json.dump({'shape': list(self.shape), 'names': self.names,
+                       'hashes': self.hashes, 'seen': self.seen}, f)
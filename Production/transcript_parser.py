@@ -0,0 +1,60 @@
+# Shared streaming parser for the [MM:SS] transcripts written by Pull_scripts_UtubeAs_IDID.py
+import re
+import mmap
+from collections import namedtuple
+
+# [MM:SS], [HH:MM:SS] and overflowed [MMM:SS] (minutes past 99) stamps
+TIMESTAMP_TOKEN = re.compile(rb'\[(\d+):(\d{2})(?::(\d{2}))?\]')
+
+TranscriptEntry = namedtuple('TranscriptEntry', ['timestamp', 'text'])
+TranscriptEntry.__doc__ = "One transcript line: start time in whole seconds and its stripped text"
+
+
+def stamp_seconds(match):
+    """Seconds for a TIMESTAMP_TOKEN match: H:MM:SS when three fields, else M:SS"""
+    first, second, third = match.groups()
+    if third is None:
+        return int(first) * 60 + int(second)
+    return int(first) * 3600 + int(second) * 60 + int(third)
+
+
+def iter_entries(data):
+    """Yield TranscriptEntry records from transcript bytes (or an mmap) in one pass
+
+    Only the timestamp token is matched; an entry's text is the raw slice
+    up to the next token, so brackets inside the text are kept and nothing
+    is backtracked. Text before the first stamp is ignored.
+    """
+    previous = None
+    for match in TIMESTAMP_TOKEN.finditer(data):
+        if previous is not None:
+            yield TranscriptEntry(stamp_seconds(previous), _text(data, previous.end(), match.start()))
+        previous = match
+    if previous is not None:
+        yield TranscriptEntry(stamp_seconds(previous), _text(data, previous.end(), len(data)))
+
+
+def _text(data, start, end):
+    return data[start:end].decode('utf-8', errors='replace').strip()
+
+
+def iter_transcript(transcript_path):
+    """Stream the entries of a transcript file through a read-only mmap
+
+    The file is never read into one string or decoded as a whole. Its pages
+    count as resident memory while they are mapped, but they are file-backed
+    and can be dropped under pressure, unlike the legacy parser's copies.
+    Empty files yield nothing.
+    """
+    with open(transcript_path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # empty file
+        with data:
+            yield from iter_entries(data)
+
+
+def read_transcript(transcript_path):
+    """All entries of a transcript file as a list"""
+    return list(iter_transcript(transcript_path))
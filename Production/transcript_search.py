@@ -0,0 +1,199 @@
+# Full-text search over the transcripts, with the frame on screen at each hit
+#
+#   python transcript_search.py "fair value gap"
+#   python transcript_search.py "optimal trade entry" --limit 5
+#
+# Queries use SQLite FTS5 syntax: words must all appear in the entry, quoted
+# words must appear as a phrase, and OR / NOT / prefix* work as usual. The
+# index is brought up to date with transcriptsT before every search; only new
+# or changed transcripts are read again.
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from collections import namedtuple
+from transcript_parser import iter_transcript
+from frame_index import FrameIntervalIndex, load_frame_timeline
+from frame_catalog import open_catalog
+
+BASE_DIR = r'D:\\AI_train_data\\Train_Prod'
+TRANSCRIPT_DIR = os.path.join(BASE_DIR, 'transcriptsT')
+UNIQUE_FRAMES_DIR = os.path.join(BASE_DIR, 'unique_frames')
+# Cluster manifests written by V4DS1vid3, used for videos missing from the catalog
+MANIFEST_DIR = os.path.join(BASE_DIR, 'manifestT')
+FRAME_CATALOG_PATH = os.path.join(BASE_DIR, 'frame_catalog.sqlite')
+SEARCH_INDEX_PATH = os.path.join(BASE_DIR, 'transcript_search.sqlite')
+
+SearchHit = namedtuple('SearchHit', ['video_id', 'timestamp', 'text', 'frame_path'])
+SearchHit.__doc__ = "One matching transcript entry and the unique frame shown at its time"
+
+
+class TranscriptSearch:
+    """SQLite FTS5 index of transcript entries, one row per timestamped entry
+
+    Entries live in a regular table indexed by video, and entries_fts is an
+    external-content FTS5 index over their text, kept in sync by triggers.
+    Replacing one transcript's entries therefore touches only its own rows
+    instead of scanning the whole full-text index. Text is stemmed (porter),
+    so "gaps" also finds "gap". The files table keeps each indexed
+    transcript's size and mtime; update() re-reads only the transcripts whose
+    size or mtime changed and drops the entries of transcripts that were
+    removed.
+    """
+
+    def __init__(self, db_path):
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                video_id TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
+                text TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_by_video ON entries(video_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+                text,
+                content = 'entries',
+                content_rowid = 'id',
+                tokenize = 'porter unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+                INSERT INTO entries_fts (rowid, text) VALUES (new.id, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+                INSERT INTO entries_fts (entries_fts, rowid, text)
+                VALUES ('delete', old.id, old.text);
+            END;
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def update(self, transcript_dir):
+        """Index new and changed transcripts in transcript_dir
+
+        Returns (transcripts indexed, transcripts removed from the index).
+        """
+        indexed = {video_id: (size, mtime_ns) for video_id, size, mtime_ns
+                   in self.connection.execute("SELECT video_id, size, mtime_ns FROM files")}
+        present = set()
+        changed = 0
+        for file_name in sorted(os.listdir(transcript_dir)):
+            if not file_name.endswith('.txt'):
+                continue
+            video_id = os.path.splitext(file_name)[0]
+            path = os.path.join(transcript_dir, file_name)
+            stat = os.stat(path)
+            present.add(video_id)
+            if indexed.get(video_id) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            with self.connection:
+                self.connection.execute("DELETE FROM entries WHERE video_id = ?", (video_id,))
+                self.connection.executemany(
+                    "INSERT INTO entries (text, video_id, timestamp) VALUES (?, ?, ?)",
+                    ((entry.text, video_id, entry.timestamp) for entry in iter_transcript(path)))
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO files (video_id, size, mtime_ns) VALUES (?, ?, ?)",
+                    (video_id, stat.st_size, stat.st_mtime_ns))
+            changed += 1
+
+        removed = set(indexed) - present
+        with self.connection:
+            for video_id in removed:
+                self.connection.execute("DELETE FROM entries WHERE video_id = ?", (video_id,))
+                self.connection.execute("DELETE FROM files WHERE video_id = ?", (video_id,))
+        return changed, len(removed)
+
+    def search(self, query, limit=20):
+        """Return [(video_id, timestamp, text)] of the best matches, best first"""
+        return self.connection.execute(
+            "SELECT e.video_id, e.timestamp, e.text FROM ("
+            "    SELECT rowid, rank FROM entries_fts WHERE entries_fts MATCH ? "
+            "    ORDER BY rank LIMIT ?"
+            ") AS hits JOIN entries e ON e.id = hits.rowid ORDER BY hits.rank",
+            (query, limit)).fetchall()
+
+
+def find(query, limit=20, index_path=None, transcript_dir=None, frames_folder=None,
+         catalog_path=None, manifest_dir=None, refresh=True):
+    """Search the transcripts and attach the unique frame shown at each hit
+
+    With refresh the index is first updated from transcript_dir. The frame
+    comes from the frame catalog or, for videos it does not know, from the
+    video's cluster manifest, whose frames are looked up in frames_folder
+    one by one; the folder is never listed. Hits get a frame_path of None
+    when neither records a frame of their video.
+    """
+    transcript_dir = transcript_dir or TRANSCRIPT_DIR
+    frames_folder = frames_folder or UNIQUE_FRAMES_DIR
+    manifest_dir = manifest_dir or MANIFEST_DIR
+    with TranscriptSearch(index_path or SEARCH_INDEX_PATH) as index:
+        if refresh:
+            index.update(transcript_dir)
+        rows = index.search(query, limit)
+
+    catalog = open_catalog(catalog_path or FRAME_CATALOG_PATH)
+    timelines = {}
+    hits = []
+    for video_id, timestamp, text in rows:
+        if video_id not in timelines:
+            manifests = [os.path.join(manifest_dir, f"{video_id}.clusters.{fmt}")
+                         for fmt in ('json', 'csv')]
+            timelines[video_id] = FrameIntervalIndex(
+                load_frame_timeline(frames_folder, video_id, manifests, catalog,
+                                    list_folder=False))
+        hits.append(SearchHit(video_id, timestamp, text, timelines[video_id].lookup(timestamp)))
+    if catalog is not None:
+        catalog.close()
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search the transcripts')
+    parser.add_argument('query', help='FTS5 query, e.g. \'"fair value gap"\'')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--index', default=SEARCH_INDEX_PATH)
+    parser.add_argument('--transcripts', default=TRANSCRIPT_DIR)
+    parser.add_argument('--frames', default=UNIQUE_FRAMES_DIR)
+    parser.add_argument('--catalog', default=FRAME_CATALOG_PATH)
+    parser.add_argument('--manifests', default=MANIFEST_DIR)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with TranscriptSearch(args.index) as index:
+        changed, removed = index.update(args.transcripts)
+    if changed or removed:
+        print(f"Indexed {changed} transcripts, removed {removed} "
+              f"in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    try:
+        hits = find(args.query, args.limit, args.index, args.transcripts,
+                    args.frames, args.catalog, args.manifests, refresh=False)
+    except sqlite3.OperationalError as e:
+        print(f"Invalid query {args.query!r}: {e}")
+        return 1
+    elapsed = (time.perf_counter() - started) * 1000
+
+    for hit in hits:
+        minutes, seconds = divmod(hit.timestamp, 60)
+        print(f"{hit.video_id} [{minutes:02d}:{seconds:02d}] {hit.text}")
+        print(f"    frame: {hit.frame_path or '(none stored)'}")
+    print(f"{len(hits)} hits in {elapsed:.1f} ms")
+
+
+if __name__ == '__main__':
+    sys.exit(main())